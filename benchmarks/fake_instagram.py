@@ -0,0 +1,82 @@
+"""
+Local Instagram stand-in: serves post pages with "video_url"/og:video
+markup and MP4 bodies of configurable size and latency.
+"""
+
+import asyncio
+import re
+import time
+import httpx
+from http_server import HTTPServer, Response
+
+RANGE_RE = re.compile(r"bytes=(\d+)-(\d*)")
+MP4_HEADER = b"\x00\x00\x00\x18ftypmp42\x00\x00\x00\x00mp42isom"
+
+class FakeInstagram:
+    def __init__(self, video_size=2 * 1024 * 1024, page_latency=0.05, cdn_latency=0.02, markup="video_url", ranges=True):
+        self.video_size = video_size
+        self.ranges = ranges
+        self.page_latency = page_latency
+        self.cdn_latency = cdn_latency
+        self.markup = markup
+        self.page_requests = 0
+        self.video_requests = 0
+        self.body = MP4_HEADER + b"\x00" * max(0, video_size - len(MP4_HEADER))
+        self.server = HTTPServer("127.0.0.1", 0)
+        self.server.fallback = self._handle
+
+    @property
+    def port(self):
+        return self.server.port
+
+    async def start(self):
+        await self.server.start()
+
+    async def stop(self):
+        await self.server.stop()
+
+    async def _handle(self, request):
+        parts = request.path.strip("/").split("/")
+        if len(parts) >= 2 and parts[0] in ("reel", "p"):
+            return await self._page(parts[1])
+        if len(parts) == 2 and parts[0] == "v":
+            return await self._video(request)
+        return Response("Not found", 404)
+
+    async def _page(self, shortcode):
+        self.page_requests += 1
+        await asyncio.sleep(self.page_latency)
+        expires = format(int(time.time()) + 3600, "x")
+        video_url = f"https://scontent.cdninstagram.com/v/{shortcode}.mp4?oe={expires}"
+        if self.markup == "og":
+            html = f'<html><head><meta property="og:video" content="{video_url}"></head></html>'
+        else:
+            escaped = video_url.replace("&", "\\u0026")
+            html = f'<html><script>{{"shortcode":"{shortcode}","video_url":"{escaped}"}}</script></html>'
+        return Response(html, content_type="text/html; charset=utf-8")
+
+    async def _video(self, request):
+        self.video_requests += 1
+        await asyncio.sleep(self.cdn_latency)
+        match = RANGE_RE.match(request.headers.get("range", ""))
+        if not self.ranges or not match:
+            return Response(self.body, content_type="video/mp4")
+        start = int(match.group(1))
+        end = min(int(match.group(2) or len(self.body) - 1), len(self.body) - 1)
+        return Response(self.body[start:end + 1], 206, "video/mp4", {
+            "Accept-Ranges": "bytes",
+            "Content-Range": f"bytes {start}-{end}/{len(self.body)}"
+        })
+
+class RewriteTransport(httpx.AsyncBaseTransport):
+    """Sends every request to the local stand-in regardless of its host"""
+    def __init__(self, port):
+        self.port = port
+        self.transport = httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request):
+        request.url = request.url.copy_with(scheme="http", host="127.0.0.1", port=self.port)
+        return await self.transport.handle_async_request(request)
+
+    async def aclose(self):
+        await self.transport.aclose()
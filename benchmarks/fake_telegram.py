@@ -0,0 +1,102 @@
+"""
+Local Telegram Bot API stand-in. Answers getMe, sendMessage, sendVideo,
+sendMediaGroup, editMessageText and friends with well-formed results and reports every
+call to an observer so the load generator can tell when a link is done.
+"""
+
+import asyncio
+import json
+import re
+import time
+import uuid
+from urllib.parse import parse_qs
+from http_server import HTTPServer, Response, json_response
+
+MULTIPART_FIELD_RE = re.compile(rb'name="([^"]+)"(; filename="[^"]*")?\r\n(?:[^\r\n]+\r\n)*\r\n(.*?)\r\n--', re.S)
+
+def parse_params(request):
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        params = {}
+        for name, filename, value in MULTIPART_FIELD_RE.findall(request.body):
+            # Uploaded files are only measured, never decoded
+            params[name.decode()] = len(value) if filename else value.decode("utf-8")
+        return params
+    if content_type.startswith("application/json"):
+        return request.json()
+    return {name: values[0] for name, values in parse_qs(request.body.decode("utf-8")).items()}
+
+class FakeTelegram:
+    def __init__(self, upload_latency=0.05, api_latency=0.005, on_call=None):
+        self.upload_latency = upload_latency
+        self.api_latency = api_latency
+        self.on_call = on_call  # on_call(method, params)
+        self.calls = {}
+        self.uploaded_bytes = 0
+        self._message_id = 0
+        self.server = HTTPServer("127.0.0.1", 0, max_body_size=200 * 1024 * 1024)
+        self.server.fallback = self._handle
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.port}"
+
+    async def start(self):
+        await self.server.start()
+
+    async def stop(self):
+        await self.server.stop()
+
+    def _message(self, params, **fields):
+        self._message_id += 1
+        chat_id = int(params.get("chat_id", 0))
+        message = {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": 1, "is_bot": True, "first_name": "bench"},
+        }
+        message.update(fields)
+        return message
+
+    async def _handle(self, request):
+        method = request.path.rsplit("/", 1)[-1]
+        params = parse_params(request)
+        self.calls[method] = self.calls.get(method, 0) + 1
+        await asyncio.sleep(self.api_latency)
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        elif method in ("sendMessage", "editMessageText"):
+            result = self._message(params, text=params.get("text", ""))
+        elif method == "sendVideo":
+            video = params.get("video")
+            if isinstance(video, int):
+                self.uploaded_bytes += video
+                await asyncio.sleep(self.upload_latency)
+                file_id = uuid.uuid4().hex
+            else:
+                file_id = video
+            result = self._message(params, video={
+                "file_id": file_id, "file_unique_id": file_id[:16],
+                "width": 720, "height": 1280, "duration": 10
+            })
+        elif method == "sendMediaGroup":
+            media = params.get("media", [])
+            if isinstance(media, str):
+                media = json.loads(media)
+            self.uploaded_bytes += sum(value for value in params.values() if isinstance(value, int))
+            await asyncio.sleep(self.upload_latency)
+            result = []
+            for item in media:
+                file_id = uuid.uuid4().hex
+                if item.get("type") == "photo":
+                    fields = {"photo": [{"file_id": file_id, "file_unique_id": file_id[:16], "width": 1080, "height": 1080}]}
+                else:
+                    fields = {"video": {"file_id": file_id, "file_unique_id": file_id[:16],
+                                        "width": 720, "height": 1280, "duration": 10}}
+                result.append(self._message(params, **fields))
+        else:
+            result = True
+        if self.on_call:
+            self.on_call(method, params)
+        return json_response({"ok": True, "result": result})
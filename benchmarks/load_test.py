@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+End-to-end load benchmark. Runs the real handlers from bot.build_application
+against local Instagram and Telegram Bot API stand-ins, fully offline.
+
+    python benchmarks/load_test.py --users 50 --links-per-user 4
+    python benchmarks/load_test.py --compare benchmarks/results/A.json benchmarks/results/B.json
+
+Each run is saved to benchmarks/results/ as JSON so runs can be compared.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_instagram import FakeInstagram, RewriteTransport
+from benchmarks.fake_telegram import FakeTelegram
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+BENCH_TOKEN = "123456:BENCHMARK"
+FIRST_CHAT_ID = 100000
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+class LoadGenerator:
+    def __init__(self, application, texts, users, links_per_user, unique_links):
+        self.application = application
+        self.users = users
+        self.links_per_user = links_per_user
+        self.unique_links = unique_links
+        self.done_texts = {texts['download_error']: 'error', texts['file_too_large']: 'oversize',
+                           texts['service_unavailable']: 'unavailable', texts['queue_full']: 'rejected'}
+        self.rejected_texts = {texts['queue_full'], texts['too_many_jobs'], texts['invalid_url'], texts['service_unavailable']}
+        self.waiters = {}  # chat_id -> future resolved with the outcome
+        self.latencies = []
+        self.outcomes = {}
+        self._update_id = 0
+
+    def on_call(self, method, params):
+        chat_id = int(params.get("chat_id", 0) or 0)
+        future = self.waiters.get(chat_id)
+        if not future or future.done():
+            return
+        text = params.get("text", "")
+        if method in ("sendVideo", "sendMediaGroup"):
+            future.set_result('success')
+        elif method == "editMessageText" and text in self.done_texts:
+            future.set_result(self.done_texts[text])
+        elif method == "sendMessage" and text in self.rejected_texts:
+            future.set_result('rejected')
+
+    def make_update(self, chat_id, text):
+        self._update_id += 1
+        return {
+            "update_id": self._update_id,
+            "message": {
+                "message_id": self._update_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"},
+                "text": text
+            }
+        }
+
+    async def virtual_user(self, chat_id):
+        from telegram import Update
+        for _ in range(self.links_per_user):
+            shortcode = f"BENCH{random.randrange(self.unique_links)}"
+            url = f"https://www.instagram.com/reel/{shortcode}/?igshid=bench{chat_id}"
+            future = asyncio.get_running_loop().create_future()
+            self.waiters[chat_id] = future
+            started = time.perf_counter()
+            update = Update.de_json(self.make_update(chat_id, url), self.application.bot)
+            await self.application.update_queue.put(update)
+            try:
+                outcome = await asyncio.wait_for(future, 120)
+            except asyncio.TimeoutError:
+                outcome = 'timeout'
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            if outcome == 'success':
+                self.latencies.append(time.perf_counter() - started)
+
+    async def run(self):
+        await asyncio.gather(*[self.virtual_user(FIRST_CHAT_ID + i) for i in range(self.users)])
+
+class ResourceSampler:
+    def __init__(self, temp_disk_usage, interval=0.05):
+        self.temp_disk_usage = temp_disk_usage
+        self.interval = interval
+        self.peak_fds = 0
+        self.peak_temp_disk = 0
+
+    async def run(self):
+        while True:
+            try:
+                self.peak_fds = max(self.peak_fds, len(os.listdir("/proc/self/fd")))
+            except OSError:
+                pass
+            self.peak_temp_disk = max(self.peak_temp_disk, self.temp_disk_usage())
+            await asyncio.sleep(self.interval)
+
+async def run_benchmark(args):
+    work_dir = tempfile.mkdtemp(prefix="botsavex-bench-")
+    os.environ.update({
+        "DATABASE_FILE": os.path.join(work_dir, "user_data.db"),
+        "FILE_CACHE_FILE": os.path.join(work_dir, "file_cache.json"),
+        "DOWNLOAD_WORKERS": str(args.workers),
+        "DOWNLOAD_MAX_QUEUE": str(args.max_queue),
+        "DOWNLOAD_STREAMING": "1" if args.streaming else "0",
+    })
+    os.environ.pop("RENDER", None)
+    previous_dir = os.getcwd()
+    os.chdir(work_dir)  # keeps the disk spool and the JSON migration inside work_dir
+    try:
+        return await measure(args)
+    finally:
+        bot = sys.modules.get("bot")
+        if bot:
+            # Close what atexit would otherwise write into the removed directory
+            bot.db.close()
+            bot.events.close()
+        os.chdir(previous_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+async def measure(args):
+    import bot
+    from config import LANGUAGES
+    logging.getLogger().setLevel(logging.WARNING)
+
+    instagram = FakeInstagram(args.video_size, args.page_latency, args.cdn_latency, ranges=args.ranges)
+    await instagram.start()
+    bot.video_downloader.transport = RewriteTransport(instagram.port)
+    telegram = FakeTelegram(args.upload_latency)
+    await telegram.start()
+    application = bot.build_application(token=BENCH_TOKEN, base_url=telegram.base_url)
+    generator = LoadGenerator(application, LANGUAGES['uz'], args.users, args.links_per_user, args.unique_links)
+    telegram.on_call = generator.on_call
+
+    sampler = ResourceSampler(bot.temp_disk_usage)
+    sampler_task = asyncio.create_task(sampler.run())
+    async with application:
+        await application.post_init(application)
+        await application.start()
+        started = time.perf_counter()
+        await generator.run()
+        duration = time.perf_counter() - started
+        await application.stop()
+        await application.post_shutdown(application)
+    sampler_task.cancel()
+    await instagram.stop()
+    await telegram.stop()
+
+    latencies = generator.latencies
+    total = args.users * args.links_per_user
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": git_revision(),
+        "label": args.label,
+        "config": {name: value for name, value in vars(args).items() if name not in ("compare", "label")},
+        "requests": total,
+        "outcomes": generator.outcomes,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(generator.outcomes.get('success', 0) / duration, 2),
+        "latency_s": {
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "max": max(latencies) if latencies else None,
+        },
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "peak_fds": sampler.peak_fds,
+        "peak_temp_disk_mb": round(sampler.peak_temp_disk / 1024 / 1024, 2),
+        "instagram": {"page_requests": instagram.page_requests, "video_requests": instagram.video_requests},
+        "telegram": {"calls": telegram.calls, "uploaded_mb": round(telegram.uploaded_bytes / 1024 / 1024, 2)},
+    }
+
+def save_result(result):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    name = result["timestamp"].replace(":", "") + (f"-{result['label']}" if result["label"] else "") + ".json"
+    path = os.path.join(RESULTS_DIR, name)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    return path
+
+def print_result(result):
+    latency = result["latency_s"]
+    fmt = lambda value: f"{value * 1000:.0f} ms" if value is not None else "-"
+    print(f"Requests:     {result['requests']} {result['outcomes']}")
+    print(f"Duration:     {result['duration_s']} s")
+    print(f"Throughput:   {result['throughput_rps']} links/s")
+    print(f"Latency:      p50 {fmt(latency['p50'])}  p95 {fmt(latency['p95'])}  p99 {fmt(latency['p99'])}")
+    print(f"Peak RSS:     {result['peak_rss_mb']} MB")
+    print(f"Peak FDs:     {result['peak_fds']}")
+    print(f"Peak temp:    {result['peak_temp_disk_mb']} MB")
+    print(f"Instagram:    {result['instagram']}")
+    print(f"Telegram:     {result['telegram']}")
+
+def compare(base_path, new_path):
+    with open(base_path, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    rows = [
+        ("throughput_rps", base["throughput_rps"], new["throughput_rps"]),
+        ("p50_s", base["latency_s"]["p50"], new["latency_s"]["p50"]),
+        ("p95_s", base["latency_s"]["p95"], new["latency_s"]["p95"]),
+        ("p99_s", base["latency_s"]["p99"], new["latency_s"]["p99"]),
+        ("peak_rss_mb", base["peak_rss_mb"], new["peak_rss_mb"]),
+        ("peak_fds", base["peak_fds"], new["peak_fds"]),
+        ("peak_temp_disk_mb", base["peak_temp_disk_mb"], new["peak_temp_disk_mb"]),
+    ]
+    fmt = lambda value: "-" if value is None else f"{value:.3f}" if isinstance(value, float) else str(value)
+    print(f"{'metric':<20}{'base':>12}{'new':>12}{'change':>10}")
+    for name, old, current in rows:
+        change = f"{(current - old) / old * 100:+.1f}%" if old and current is not None else "-"
+        print(f"{name:<20}{fmt(old):>12}{fmt(current):>12}{change:>10}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline end-to-end load benchmark")
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--links-per-user", type=int, default=5)
+    parser.add_argument("--unique-links", type=int, default=50, help="distinct shortcodes to draw from")
+    parser.add_argument("--video-size", type=int, default=2 * 1024 * 1024, help="MP4 body size in bytes")
+    parser.add_argument("--page-latency", type=float, default=0.05, help="seconds per Instagram page")
+    parser.add_argument("--cdn-latency", type=float, default=0.02, help="seconds before the MP4 body")
+    parser.add_argument("--upload-latency", type=float, default=0.05, help="seconds per sendVideo upload")
+    parser.add_argument("--workers", type=int, default=4, help="download worker pool size")
+    parser.add_argument("--max-queue", type=int, default=1000)
+    parser.add_argument("--no-streaming", dest="streaming", action="store_false", help="use temp files")
+    parser.add_argument("--no-ranges", dest="ranges", action="store_false", help="CDN ignores Range headers")
+    parser.add_argument("--label", default="", help="suffix for the results file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="compare two result files")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.compare:
+        compare(*args.compare)
+        return
+    result = asyncio.run(run_benchmark(args))
+    print_result(result)
+    print(f"Saved: {save_result(result)}")
+
+if __name__ == "__main__":
+    main()
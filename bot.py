@@ -1,10 +1,24 @@
 import os
+import asyncio
 import logging
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto, InputMediaVideo
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
-from config import BOT_TOKEN, ADMIN_ID, LANGUAGES, DOWNLOAD_SETTINGS
-from video_downloader import VideoDownloader
-from database import get_user_language as db_get_user_language, set_user_language as db_set_user_language, db
+from telegram.error import TelegramError
+from config import BOT_TOKEN, ADMIN_ID, LANGUAGES, DOWNLOAD_SETTINGS, FILE_CACHE_SETTINGS, WEBHOOK_SETTINGS, METRICS_SETTINGS, TRANSCODE_SETTINGS, WORKER_SETTINGS, SPOOL_SETTINGS
+from video_downloader import VideoDownloader, FileTooLargeError
+from resilience import CircuitOpenError
+from download_queue import DownloadScheduler, QueueFullError, UserLimitError
+from job_queue import JobQueue
+from file_cache import FileIdCache
+from transcoder import Transcoder
+from spool import SpoolManager, SpoolFullError
+from webhook import run_webhook
+from http_server import HTTPServer, Response
+import metrics
+from metrics import (Gauge, REQUESTS, UPLOAD_SECONDS, EXTRACT_SECONDS, DOWNLOAD_SECONDS, DOWNLOADS_IN_FLIGHT,
+                     TRANSCODE_SECONDS, TRANSCODE_CPU_SECONDS, TRANSCODE_BYTES_SAVED, UPSTREAM_RETRIES, UPSTREAM_HEDGES)
+from database import db
+from events import events
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -13,32 +27,85 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 video_downloader = VideoDownloader()
+download_scheduler = DownloadScheduler(
+    workers=DOWNLOAD_SETTINGS['workers'],
+    max_queue_size=DOWNLOAD_SETTINGS['max_queue_size'],
+    max_jobs_per_user=DOWNLOAD_SETTINGS['max_jobs_per_user']
+)
+file_id_cache = FileIdCache(
+    cache_file=FILE_CACHE_SETTINGS['cache_file'],
+    max_size=FILE_CACHE_SETTINGS['max_size'],
+    ttl=FILE_CACHE_SETTINGS['ttl']
+)
+transcoder = Transcoder(TRANSCODE_SETTINGS)
+spool_manager = SpoolManager(SPOOL_SETTINGS)
+# Split mode: downloads run in worker.py processes fed through this queue
+job_queue = JobQueue(
+    db_file=WORKER_SETTINGS['queue_file'],
+    lease_seconds=WORKER_SETTINGS['lease_seconds'],
+    max_attempts=WORKER_SETTINGS['max_attempts']
+) if WORKER_SETTINGS['mode'] == 'split' else None
+
+VIDEO_CAPTION = "✅ Video @savexdownloadbot orqali yuklandi!"
+
+# Only the update types the handlers in build_application consume
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
+def temp_disk_usage():
+    return spool_manager.disk_usage()
+
+Gauge("botsavex_temp_disk_bytes", "Bytes used by temporary video files", temp_disk_usage)
+Gauge("botsavex_spool_reserved_bytes", "Bytes reserved against the spool quota", lambda: spool_manager.reserved)
+Gauge("botsavex_upstream_circuits_open", "Upstream hosts whose circuit is not closed", lambda: video_downloader.upstream.open_circuits)
+def pending_jobs():
+    if job_queue:
+        counts = job_queue.cached_counts
+        return counts.get('held', 0) + counts.get('pending', 0)
+    return download_scheduler.pending
+
+Gauge("botsavex_queue_pending", "Download jobs waiting for a worker", pending_jobs)
+metrics_server = None
+
+class UserPrefs:
+    """Preferences resolved once per update and reused by every handler step"""
+    def __init__(self, user_id, fresh=False):
+        self.user_id = user_id
+        # Download workers pass fresh=True: the front process writes these
+        self.info = db.get_user_info(user_id, fresh=fresh)
 
-def get_user_language(user_id):
-    lang = db_get_user_language(user_id)
-    if not lang:
-        return 'uz'
-    return lang
+    @property
+    def language(self):
+        return self.info.get('language', 'uz')
 
-def get_text(user_id, key):
-    lang = get_user_language(user_id)
-    return LANGUAGES[lang][key]
+    @property
+    def language_set(self):
+        return self.info.get('language_set', False)
+
+    def set_language(self, language):
+        changes = {'language': language, 'language_set': True}
+        db.set_user_info(self.user_id, changes)
+        self.info.update(changes)
+
+def get_text(user, key):
+    return LANGUAGES[user.language or 'uz'][key]
+
+def record_result(user, link, result):
+    REQUESTS.inc(platform=link.platform, result=result)
+    events.record('download', user_id=user.user_id, language=user.language,
+                  platform=link.platform, media=link.key, result=result)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.effective_user or not update.message:
         return
-    user_id = update.effective_user.id
+    user = UserPrefs(update.effective_user.id)
     user_name = update.effective_user.first_name
-    user_lang = db_get_user_language(user_id)
-    if not user_lang:
-        user_info = db.get_user_info(user_id)
-        if not user_info.get('language_set'):
-            await show_language_selection(update, context)
-            return
-    welcome_text = get_text(user_id, 'welcome').format(user_name)
+    if not user.language and not user.language_set:
+        await show_language_selection(update, context, user)
+        return
+    welcome_text = get_text(user, 'welcome').format(user_name)
     await update.message.reply_text(welcome_text)
 
-async def show_language_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def show_language_selection(update: Update, context: ContextTypes.DEFAULT_TYPE, user=None):
     if update.message:
         reply_func = update.message.reply_text
     elif update.callback_query:
@@ -55,8 +122,10 @@ async def show_language_selection(update: Update, context: ContextTypes.DEFAULT_
         ]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
+    if user is None:
+        user = UserPrefs(update.effective_user.id)
     await reply_func(
-        get_text(update.effective_user.id, 'language_select'),
+        get_text(user, 'language_select'),
         reply_markup=reply_markup
     )
 
@@ -69,11 +138,12 @@ async def language_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not query.data:
         return
     lang_code = query.data.split('_')[1]
-    db_set_user_language(user_id, lang_code)
-    db.set_user_info(user_id, {'language_set': True})
-    await query.edit_message_text(get_text(user_id, 'language_changed'))
+    user = UserPrefs(user_id)
+    user.set_language(lang_code)
+    events.record('language', user_id=user_id, language=lang_code)
+    await query.edit_message_text(get_text(user, 'language_changed'))
     user_name = query.from_user.first_name
-    welcome_text = get_text(user_id, 'welcome').format(user_name)
+    welcome_text = get_text(user, 'welcome').format(user_name)
     await context.bot.send_message(chat_id=user_id, text=welcome_text)
 
 async def language_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -82,13 +152,13 @@ async def language_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def support_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.effective_user or not update.message:
         return
-    user_id = update.effective_user.id
+    user = UserPrefs(update.effective_user.id)
     username = update.effective_user.username
     if not username:
         no_username_text = "❌ Support yozish uchun @username bo'lishi kerak!\n\n📝 Username qo'shish uchun:\n1. Telegram sozlamalariga kiring\n2. Username qo'shing\n3. Qaytadan /support buyrug'ini yuboring"
         await update.message.reply_text(no_username_text)
         return
-    feedback_text = get_text(user_id, 'support_message')
+    feedback_text = get_text(user, 'support_message')
     await update.message.reply_text(feedback_text)
     if context.user_data is None:
         context.user_data = {}
@@ -104,7 +174,7 @@ async def donate_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         ]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
-    donate_text = get_text(update.effective_user.id, 'donate_message').split('\n')[0] + " usulini tanlang:"
+    donate_text = get_text(UserPrefs(update.effective_user.id), 'donate_message').split('\n')[0] + " usulini tanlang:"
     await update.message.reply_text(donate_text, reply_markup=reply_markup)
 
 async def donate_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -113,70 +183,306 @@ async def donate_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     if query.data == "donate_card":
-        card_text = get_text(query.from_user.id, 'donate_message')
+        card_text = get_text(UserPrefs(query.from_user.id), 'donate_message')
         await query.edit_message_text(card_text)
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.effective_user or not update.message:
         return
-    user_id = update.effective_user.id
-    help_text = get_text(user_id, 'help_text')
+    user = UserPrefs(update.effective_user.id)
+    help_text = get_text(user, 'help_text')
     await update.message.reply_text(help_text)
 
-def is_valid_video_url(url):
-    return video_downloader.is_valid_url(url)
+async def send_media(bot, chat_id, media):
+    """Send (kind, file) pairs as albums of up to media_group_size, return their file_ids"""
+    group_size = DOWNLOAD_SETTINGS['media_group_size']
+    file_ids = []
+    for start in range(0, len(media), group_size):
+        chunk = media[start:start + group_size]
+        caption = VIDEO_CAPTION if start == 0 else None
+        if len(chunk) == 1:
+            # Albums need at least two items
+            kind, file = chunk[0]
+            if kind == 'video':
+                message = await bot.send_video(chat_id=chat_id, video=file, filename="video.mp4", caption=caption)
+            else:
+                message = await bot.send_photo(chat_id=chat_id, photo=file, filename="photo.jpg", caption=caption)
+            messages = [message]
+        else:
+            messages = await bot.send_media_group(chat_id=chat_id, media=[
+                InputMediaVideo(file, caption=caption if i == 0 else None, filename=f"video_{i}.mp4")
+                if kind == 'video' else
+                InputMediaPhoto(file, caption=caption if i == 0 else None, filename=f"photo_{i}.jpg")
+                for i, (kind, file) in enumerate(chunk)
+            ])
+        for message in messages:
+            if message.video:
+                file_ids.append(['video', message.video.file_id])
+            elif message.photo:
+                file_ids.append(['photo', message.photo[-1].file_id])
+    return file_ids
+
+async def send_cached_video(bot, chat_id, user, link):
+    file_id = file_id_cache.get(link.key)
+    if not file_id:
+        return False
+    try:
+        with UPLOAD_SECONDS.time(cached=True):
+            if isinstance(file_id, list):
+                # Carousel posts are cached as a list of (kind, file_id)
+                await send_media(bot, chat_id, [tuple(item) for item in file_id])
+            else:
+                await bot.send_video(
+                    chat_id=chat_id,
+                    video=file_id,
+                    caption=VIDEO_CAPTION
+                )
+    except TelegramError as e:
+        logger.error(f"Cached file_id for {link.key} failed: {e}")
+        file_id_cache.delete(link.key)
+        return False
+    record_result(user, link, 'cached')
+    return True
 
-async def download_video(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def enqueue_download(update: Update, context: ContextTypes.DEFAULT_TYPE, user, link):
     if not update.effective_user or not update.message:
         return
-    user_id = update.effective_user.id
-    url = update.message.text
-    if not url:
-        download_error_text = get_text(user_id, 'download_error')
-        await update.message.reply_text(download_error_text)
-        return
-    if 'tiktok.com' in url.lower() or 'vt.tiktok.com' in url.lower():
+    if not link.extractor.supported:
         tiktok_message = "⚠️ TikTok video yuklash funksiyasi hozircha mavjud emas.\n\n🔧 Texnik ishlar olib borilmoqda...\n\n✅ Instagram videolarini yuklash mumkin!"
         await update.message.reply_text(tiktok_message)
+        record_result(user, link, 'unsupported')
+        return
+    if await send_cached_video(context.bot, update.effective_chat.id, user, link):
+        return
+    if not video_downloader.available(link):
+        # Fail fast instead of queueing work for an upstream that is down
+        record_result(user, link, 'unavailable')
+        await update.message.reply_text(get_text(user, 'service_unavailable'))
+        return
+    if job_queue:
+        await enqueue_job(update, user, link)
         return
-    downloading_text = get_text(user_id, 'downloading')
-    status_message = await update.message.reply_text(downloading_text)
+    status_ready = asyncio.get_running_loop().create_future()
+
+    async def job():
+        await download_video(context.bot, update.effective_chat.id, await status_ready, user, link)
+
     try:
-        video_url = video_downloader.get_video_url(url)
-        temp_dir = DOWNLOAD_SETTINGS['temp_folder']
-        if os.getenv("RENDER"):
-            temp_dir = "/tmp"
-        else:
-            os.makedirs(temp_dir, exist_ok=True)
-        import uuid
-        filename = os.path.join(temp_dir, f"video_{uuid.uuid4().hex[:8]}.mp4")
-        if video_url:
-            downloaded_file = video_downloader.download_video(video_url, filename)
-            if downloaded_file and os.path.exists(downloaded_file):
-                file_size = os.path.getsize(downloaded_file)
-                if file_size > DOWNLOAD_SETTINGS['max_file_size']:
-                    os.remove(downloaded_file)
-                    download_error_text = get_text(user_id, 'download_error')
-                    await status_message.edit_text(download_error_text)
-                    return
-                if not update.effective_chat:
-                    return
-                with open(downloaded_file, 'rb') as video_file:
-                    await context.bot.send_video(
-                        chat_id=update.effective_chat.id,
-                        video=video_file,
-                        caption="✅ Video @savexdownloadbot orqali yuklandi!"
-                    )
+        position = await download_scheduler.submit(user.user_id, job)
+    except (QueueFullError, UserLimitError) as e:
+        await reject_download(update, user, link, e)
+        return
+    try:
+        queued_text = get_text(user, 'queued').format(position)
+        status_ready.set_result(await update.message.reply_text(queued_text))
+    except Exception as e:
+        status_ready.set_exception(e)
+        raise
+
+async def enqueue_job(update: Update, user, link):
+    """Split mode: hand the link to the download workers through the durable queue"""
+    payload = {'user_id': user.user_id, 'chat_id': update.effective_chat.id, 'url': link.canonical_url}
+    try:
+        job_id, position = await asyncio.to_thread(
+            job_queue.reserve, user.user_id, payload,
+            DOWNLOAD_SETTINGS['max_queue_size'], DOWNLOAD_SETTINGS['max_jobs_per_user']
+        )
+    except (QueueFullError, UserLimitError) as e:
+        await reject_download(update, user, link, e)
+        return
+    try:
+        status_message = await update.message.reply_text(get_text(user, 'queued').format(position))
+    except Exception:
+        await asyncio.to_thread(job_queue.discard, job_id)
+        raise
+    # Workers edit this message, so the job only becomes visible once it exists
+    await asyncio.to_thread(job_queue.publish, job_id, status_message_id=status_message.message_id)
+
+async def reject_download(update: Update, user, link, error):
+    record_result(user, link, 'rejected')
+    key = 'queue_full' if isinstance(error, QueueFullError) else 'too_many_jobs'
+    await update.message.reply_text(get_text(user, key))
+
+async def fetch_media(media_url, max_size, spool, extension="mp4"):
+    """Download into memory or a spool file, depending on the streaming setting"""
+    # ffmpeg needs the video on disk, and may shrink one that is over max_size
+    transcode = extension == "mp4" and transcoder.available
+    limit = max(max_size, transcoder.max_input_size) if transcode else max_size
+    # Reserve the worst case up front, then hand back what the file did not use
+    await spool.extend(limit)
+    if DOWNLOAD_SETTINGS['streaming'] and not transcode:
+        buffer = await video_downloader.download_to_buffer(media_url, max_size)
+        await spool.release(limit - (len(buffer.getbuffer()) if buffer else 0))
+        return buffer
+    downloaded_file = await video_downloader.download_video(media_url, spool.path(extension), limit)
+    size = os.path.getsize(downloaded_file) if downloaded_file else 0
+    await spool.release(limit - size)
+    if downloaded_file and transcode:
+        # Room for ffmpeg's output while the input is still on disk
+        headroom = min(size, max_size)
+        await spool.extend(headroom)
+        try:
+            output = await transcoder.process(downloaded_file, max_size)
+            if output and output != downloaded_file:
+                spool.track(output)
                 os.remove(downloaded_file)
-                video_sent_text = get_text(user_id, 'video_sent')
-                await status_message.edit_text(video_sent_text)
+                # The output takes the input's place in the reservation
+                headroom += size - os.path.getsize(output)
+        finally:
+            await spool.release(headroom)
+        if not output:
+            raise FileTooLargeError()
+        downloaded_file = output
+    return open(downloaded_file, 'rb') if downloaded_file else None
+
+async def download_carousel(bot, chat_id, status_message, user, link, items, spool):
+    max_size = DOWNLOAD_SETTINGS['max_file_size']
+    semaphore = asyncio.Semaphore(DOWNLOAD_SETTINGS['carousel_concurrency'])
+    oversize = []
+
+    async def fetch_item(item):
+        async with semaphore:
+            try:
+                file = await fetch_media(item.url, max_size, spool, "mp4" if item.kind == 'video' else "jpg")
+            except FileTooLargeError:
+                # One oversize item should not cost the user the whole post
+                oversize.append(item)
+                return None
+        if not file:
+            return None
+        with file:
+            return item.kind, file.read()
+
+    tasks = [asyncio.create_task(fetch_item(item)) for item in items]
+    try:
+        media = [entry for entry in await asyncio.gather(*tasks) if entry]
+    finally:
+        # On SpoolFullError and the like, stop the other items before the
+        # caller closes the spool under them
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    if not media:
+        raise FileTooLargeError() if oversize else RuntimeError("No carousel item downloaded")
+    with UPLOAD_SECONDS.time(cached=False):
+        file_ids = await send_media(bot, chat_id, media)
+    if len(media) == len(items) and file_ids:
+        file_id_cache.set(link.key, file_ids)
+    record_result(user, link, 'success')
+    await status_message.edit_text(get_text(user, 'video_sent'))
+
+async def download_video(bot, chat_id, status_message, user, link):
+    async with spool_manager.spool() as spool:
+        try:
+            downloading_text = get_text(user, 'downloading')
+            await status_message.edit_text(downloading_text)
+            items = await video_downloader.get_media(link)
+            if not items:
+                record_result(user, link, 'error')
+                download_error_text = get_text(user, 'download_error')
+                await status_message.edit_text(download_error_text)
                 return
-        download_error_text = get_text(user_id, 'download_error')
-        await status_message.edit_text(download_error_text)
-    except Exception as e:
-        logger.error(f"Error downloading video: {e}")
-        download_error_text = get_text(user_id, 'download_error')
-        await status_message.edit_text(download_error_text)
+            if len(items) > 1 or items[0].kind != 'video':
+                await download_carousel(bot, chat_id, status_message, user, link, items, spool)
+                return
+            video = await fetch_media(items[0].url, DOWNLOAD_SETTINGS['max_file_size'], spool)
+            if not video:
+                record_result(user, link, 'error')
+                download_error_text = get_text(user, 'download_error')
+                await status_message.edit_text(download_error_text)
+                return
+            with video, UPLOAD_SECONDS.time(cached=False):
+                # python-telegram-bot reads file objects whole and needs a real
+                # file name on them, which a memory spool does not have
+                message = await bot.send_video(
+                    chat_id=chat_id,
+                    video=video.read(),
+                    filename="video.mp4",
+                    caption=VIDEO_CAPTION
+                )
+            if message.video:
+                file_id_cache.set(link.key, message.video.file_id)
+            record_result(user, link, 'success')
+            video_sent_text = get_text(user, 'video_sent')
+            await status_message.edit_text(video_sent_text)
+        except FileTooLargeError:
+            record_result(user, link, 'oversize')
+            file_too_large_text = get_text(user, 'file_too_large')
+            await status_message.edit_text(file_too_large_text)
+        except SpoolFullError:
+            record_result(user, link, 'rejected')
+            await status_message.edit_text(get_text(user, 'queue_full'))
+        except CircuitOpenError:
+            record_result(user, link, 'unavailable')
+            await status_message.edit_text(get_text(user, 'service_unavailable'))
+        except Exception as e:
+            logger.error(f"Error downloading video: {e}")
+            record_result(user, link, 'error')
+            download_error_text = get_text(user, 'download_error')
+            await status_message.edit_text(download_error_text)
+
+def format_seconds(value):
+    return f"{value:.2f}s" if value is not None else "-"
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not update.effective_user or not update.message:
+        return
+    if update.effective_user.id != ADMIN_ID:
+        return
+    download_mode = 'memory' if DOWNLOAD_SETTINGS['streaming'] and not transcoder.available else 'file'
+    stages = [
+        ("Extract", EXTRACT_SECONDS, {'platform': 'instagram'}),
+        ("Download", DOWNLOAD_SECONDS, {'mode': download_mode}),
+        ("Upload", UPLOAD_SECONDS, {'cached': False}),
+    ]
+    if transcoder.available:
+        stages.append(("Transcode", TRANSCODE_SECONDS, {'op': 'transcode'}))
+        stages.append(("Faststart", TRANSCODE_SECONDS, {'op': 'remux'}))
+    # Rollups kept up to date by the event log, so this never scans it
+    usage = events.summary(hours=24, top=5)
+    last_day = usage['recent']
+    total_day = sum(last_day.values())
+    failed_day = sum(last_day.get(result, 0) for result in ('error', 'oversize', 'unavailable'))
+    lines = ["📊 Statistika", ""]
+    lines.append(f"📥 Jami: {usage['total']} ta havola, 24 soatda: {total_day}")
+    lines += [f"  {result}: {count}" for result, count in sorted(last_day.items())]
+    if total_day:
+        lines.append(f"❗ Xatolar (24 soat): {failed_day / total_day:.1%}")
+    languages = ", ".join(f"{language}: {count}" for language, count in sorted(usage['language_users'].items()) if count)
+    lines.append(f"👥 Foydalanuvchilar: {languages or '-'}")
+    top = usage['top_media']
+    if top:
+        lines.append("🔥 Top: " + ", ".join(f"{media.split(':', 1)[-1]} ({count})" for media, count, _ in top))
+    lines.append("")
+    for title, histogram, labels in stages:
+        p50 = format_seconds(histogram.quantile(0.5, **labels))
+        p95 = format_seconds(histogram.quantile(0.95, **labels))
+        lines.append(f"{title}: p50 {p50} / p95 {p95} ({histogram.count(**labels)})")
+    lines.append("")
+    if job_queue:
+        lines.append(f"⏳ Navbat: {pending_jobs()}, yuklanmoqda: {job_queue.cached_counts.get('leased', 0)}")
+    else:
+        lines.append(f"⏳ Navbat: {download_scheduler.pending}, yuklanmoqda: {DOWNLOADS_IN_FLIGHT.get()}")
+    lines.append(f"💾 Temp: {temp_disk_usage() / 1024 / 1024:.1f} MB, "
+                 f"band: {spool_manager.reserved / 1024 / 1024:.0f}/{spool_manager.quota / 1024 / 1024:.0f} MB ({spool_manager.directory})")
+    if transcoder.available:
+        cpu = sum(TRANSCODE_CPU_SECONDS.values.values())
+        saved = sum(TRANSCODE_BYTES_SAVED.values.values())
+        lines.append(f"🎞 ffmpeg: {cpu:.1f}s CPU, {saved / 1024 / 1024:.1f} MB saved")
+    lines.append(f"🗂 file_id cache: {file_id_cache.hits} hit / {file_id_cache.misses} miss")
+    url_cache = video_downloader.url_cache
+    lines.append(f"🔗 URL cache: {url_cache.hits} hit / {url_cache.coalesced} coalesced / {url_cache.misses} miss")
+    upstream = video_downloader.upstream
+    for host, breaker in upstream.breakers.items():
+        p95 = format_seconds(upstream.tracker(host).quantile(0.95))
+        lines.append(f"🌐 {host}: {breaker.state}, p95 {p95}, "
+                     f"{UPSTREAM_RETRIES.get(host=host)} retry / {UPSTREAM_HEDGES.get(host=host)} hedge")
+    await update.message.reply_text("\n".join(lines))
+
+async def metrics_endpoint(request):
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+METRICS_ROUTES = {("GET", "/metrics"): metrics_endpoint}
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.effective_user or not update.message:
@@ -185,12 +491,10 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if message_text and message_text.startswith('/'):
         return
     user_id = update.effective_user.id
-    user_lang = db_get_user_language(user_id)
-    if not user_lang:
-        user_info = db.get_user_info(user_id)
-        if not user_info.get('language_set'):
-            await show_language_selection(update, context)
-            return
+    user = UserPrefs(user_id)
+    if not user.language and not user.language_set:
+        await show_language_selection(update, context, user)
+        return
     if not message_text:
         return
     if context.user_data is None:
@@ -203,9 +507,11 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         admin_message = f"📞 Yangi foydalanuvchi fikri:\n\n👤 Foydalanuvchi: {user_name}\n🆔 ID: {user_id}\n👤 Username: @{username if username else 'Yo\'q'}\n💬 Fikr: {message_text}"
         await context.bot.send_message(chat_id=ADMIN_ID, text=admin_message)
         context.user_data['waiting_for_feedback'] = False
+        events.record('message', user_id=user_id, language=user.language, result='feedback')
         return
-    if is_valid_video_url(message_text):
-        await download_video(update, context)
+    link = video_downloader.resolve(message_text)
+    if link:
+        await enqueue_download(update, context, user, link)
     else:
         if any(word in message_text.lower() for word in ["support", "yordam", "помощь", "help"]):
             confirmation_text = "✅ Xabaringiz yuborildi! Tez orada javob beramiz."
@@ -214,24 +520,77 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             username = update.effective_user.username
             admin_message = f"📞 Yangi qo'llab-quvvatlash so'rovi:\n\n👤 Foydalanuvchi: {user_name}\n🆔 ID: {user_id}\n👤 Username: @{username if username else 'Yo\'q'}\n💬 Xabar: {message_text}"
             await context.bot.send_message(chat_id=ADMIN_ID, text=admin_message)
+            events.record('message', user_id=user_id, language=user.language, result='support')
         else:
-            invalid_url_text = get_text(user_id, 'invalid_url')
+            invalid_url_text = get_text(user, 'invalid_url')
             await update.message.reply_text(invalid_url_text)
+            events.record('message', user_id=user_id, language=user.language, result='invalid')
+
+async def post_init(application: Application):
+    global metrics_server
+    spool_manager.start()
+    if job_queue:
+        job_queue.start(WORKER_SETTINGS['poll_interval'])
+    else:
+        download_scheduler.start()
+    if WEBHOOK_SETTINGS['mode'] != 'webhook' and METRICS_SETTINGS['port']:
+        metrics_server = HTTPServer(port=METRICS_SETTINGS['port'])
+        for (method, path), handler in METRICS_ROUTES.items():
+            metrics_server.route(method, path, handler)
+        await metrics_server.start()
+
+async def post_shutdown(application: Application):
+    if metrics_server:
+        await metrics_server.stop()
+    await download_scheduler.stop()
+    await spool_manager.stop()
+    await video_downloader.close()
+    transcoder.close()
+    file_id_cache.close()
+    events.flush()
+    if job_queue:
+        await job_queue.stop()
+        job_queue.close()
+
+def health():
+    return {
+        "status": "ok",
+        "queued": pending_jobs(),
+        "running": job_queue.cached_counts.get('leased', 0) if job_queue else download_scheduler.running
+    }
+
+def build_application(token=BOT_TOKEN, base_url=None):
+    builder = (
+        Application.builder()
+        .token(token)
+        .concurrent_updates(WEBHOOK_SETTINGS['concurrent_updates'])
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if base_url:
+        # Points the bot at a Bot API stand-in, e.g. for benchmarks
+        builder = builder.base_url(f"{base_url}/bot").base_file_url(f"{base_url}/file/bot")
+    application = builder.build()
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("language", language_command))
+    application.add_handler(CommandHandler("support", support_command))
+    application.add_handler(CommandHandler("donate", donate_command))
+    application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(CallbackQueryHandler(language_callback, pattern="^lang_"))
+    application.add_handler(CallbackQueryHandler(donate_callback, pattern="^donate_"))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    return application
 
 def main():
     try:
-        application = Application.builder().token(BOT_TOKEN).build()
-        application.add_handler(CommandHandler("start", start))
-        application.add_handler(CommandHandler("language", language_command))
-        application.add_handler(CommandHandler("support", support_command))
-        application.add_handler(CommandHandler("donate", donate_command))
-        application.add_handler(CommandHandler("help", help_command))
-        application.add_handler(CallbackQueryHandler(language_callback, pattern="^lang_"))
-        application.add_handler(CallbackQueryHandler(donate_callback, pattern="^donate_"))
-        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+        application = build_application()
         print("🚀 Bot ishga tushirilmoqda...")
         print("✅ Bot ishga tushdi!")
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        if WEBHOOK_SETTINGS['mode'] == 'webhook':
+            asyncio.run(run_webhook(application, WEBHOOK_SETTINGS, ALLOWED_UPDATES, health, METRICS_ROUTES))
+        else:
+            application.run_polling(allowed_updates=ALLOWED_UPDATES)
     except Exception as e:
         logger.error(f"Bot xatoligi: {e}")
         print(f"❌ Bot xatoligi: {e}")
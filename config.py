@@ -14,7 +14,12 @@ LANGUAGES = {
         'downloading': "⏳ Video yuklanmoqda...",
         'download_error': "❌ Videoni yuklab olishda xatolik yuz berdi.",
         'video_sent': "✅ Video muvaffaqiyatli yuklandi!",
-        'help_text': "📋 Mavjud komandalar:\n/start - Botni ishga tushirish\n/language - Tilni o'zgartirish\n/support - Qo'llab-quvvatlash\n/donate - Donat qilish\n/help - Yordam"
+        'help_text': "📋 Mavjud komandalar:\n/start - Botni ishga tushirish\n/language - Tilni o'zgartirish\n/support - Qo'llab-quvvatlash\n/donate - Donat qilish\n/help - Yordam",
+        'queued': "⏳ Navbatga qo'shildi. Sizning o'rningiz: {}",
+        'queue_full': "⚠️ Hozir so'rovlar juda ko'p. Birozdan so'ng qayta urinib ko'ring.",
+        'too_many_jobs': "⚠️ Oldingi videolaringiz hali yuklanmoqda. Ular tugashini kuting.",
+        'file_too_large': "❌ Video juda katta (50MB dan oshadi), uni yuborib bo'lmaydi.",
+        'service_unavailable': "⚠️ Instagram hozir javob bermayapti. Bir necha daqiqadan so'ng qayta urinib ko'ring."
     },
     'en': {
         'welcome': "🎉 Welcome, {}!\n\n📱 This bot is used to download Instagram and TikTok videos.\n\n📤 Send a video link and I will download it for you.\n\n💡 Usage:\n• Send Instagram video link\n• Send TikTok video link\n• Video will be downloaded automatically",
@@ -26,7 +31,12 @@ LANGUAGES = {
         'downloading': "⏳ Downloading video...",
         'download_error': "❌ Error occurred while downloading video.",
         'video_sent': "✅ Video downloaded successfully!",
-        'help_text': "📋 Available commands:\n/start - Start the bot\n/language - Change language\n/support - Support\n/donate - Donate\n/help - Help"
+        'help_text': "📋 Available commands:\n/start - Start the bot\n/language - Change language\n/support - Support\n/donate - Donate\n/help - Help",
+        'queued': "⏳ Added to the queue. Your position: {}",
+        'queue_full': "⚠️ The bot is busy right now. Please try again in a moment.",
+        'too_many_jobs': "⚠️ Your previous videos are still downloading. Please wait for them to finish.",
+        'file_too_large': "❌ The video is too large (over 50MB) to be sent.",
+        'service_unavailable': "⚠️ Instagram is not responding right now. Please try again in a few minutes."
     },
     'ru': {
         'welcome': "🎉 Добро пожаловать, {}!\n\n📱 Этот бот используется для скачивания видео из Instagram и TikTok.\n\n📤 Отправьте ссылку на видео, и я скачаю его для вас.\n\n💡 Использование:\n• Отправьте ссылку на видео Instagram\n• Отправьте ссылку на видео TikTok\n• Видео будет скачано автоматически",
@@ -38,12 +48,118 @@ LANGUAGES = {
         'downloading': "⏳ Скачивание видео...",
         'download_error': "❌ Произошла ошибка при скачивании видео.",
         'video_sent': "✅ Видео успешно скачано!",
-        'help_text': "📋 Доступные команды:\n/start - Запустить бота\n/language - Изменить язык\n/support - Поддержка\n/donate - Пожертвовать\n/help - Помощь"
+        'help_text': "📋 Доступные команды:\n/start - Запустить бота\n/language - Изменить язык\n/support - Поддержка\n/donate - Пожертвовать\n/help - Помощь",
+        'queued': "⏳ Добавлено в очередь. Ваша позиция: {}",
+        'queue_full': "⚠️ Сейчас слишком много запросов. Попробуйте немного позже.",
+        'too_many_jobs': "⚠️ Ваши предыдущие видео ещё скачиваются. Дождитесь их завершения.",
+        'file_too_large': "❌ Видео слишком большое (больше 50MB) для отправки.",
+        'service_unavailable': "⚠️ Instagram сейчас не отвечает. Попробуйте через несколько минут."
     }
 }
 
 DOWNLOAD_SETTINGS = {
     'max_file_size': 50 * 1024 * 1024,  # 50MB
     'download_timeout': 30,  # seconds
-    'temp_folder': 'temp_videos'
-} 
\ No newline at end of file
+    'temp_folder': 'temp_videos',
+    'max_connections': int(os.getenv("DOWNLOAD_MAX_CONNECTIONS", "50")),
+    'chunk_size': 64 * 1024,  # 64KB
+    'url_cache_ttl': 600,  # seconds, capped by the CDN link expiry
+    'streaming': os.getenv("DOWNLOAD_STREAMING", "1") == "1",  # download into memory instead of temp files
+    'segment_size': 4 * 1024 * 1024,  # 4MB Range segments for large files
+    'max_segments': 4,  # parallel Range connections per download
+    'segment_retries': 3,
+    'max_buffer_size': 1024 * 1024,  # 1MB, cap for the single stream write buffer
+    'workers': int(os.getenv("DOWNLOAD_WORKERS", "4")),
+    'max_queue_size': int(os.getenv("DOWNLOAD_MAX_QUEUE", "100")),
+    'max_jobs_per_user': int(os.getenv("DOWNLOAD_MAX_JOBS_PER_USER", "2")),
+    'carousel_concurrency': 3,  # parallel item downloads within one carousel post
+    'media_group_size': 10  # Telegram's limit per sendMediaGroup
+} 
+
+EVENT_LOG_SETTINGS = {
+    'log_file': os.getenv("EVENT_LOG_FILE", "events.jsonl"),
+    'max_bytes': 10 * 1024 * 1024,  # rotate at 10MB
+    'backups': 5,  # rotated files kept, and replayed into the rollups at startup
+    'flush_interval': 1.0,  # seconds between batched appends
+    'top_k': 100,  # media ids tracked by the top-K sketch
+    'hours': 168  # hourly buckets kept in memory (7 days)
+}
+
+RESILIENCE_SETTINGS = {
+    'attempt_timeout': 10,  # seconds per page request, retries included in download_timeout
+    'max_retries': 2,  # on 429/5xx and connection errors
+    'backoff_base': 0.5,  # seconds, doubled per retry with full jitter
+    'backoff_max': 8,
+    'hedge': True,  # send a second request once the first runs past the host's p95
+    'hedge_min_samples': 20,  # latencies needed before p95 is trusted
+    'hedge_ratio': 0.1,  # at most this share of calls get hedged
+    'latency_window': 200,
+    'failure_threshold': 5,  # consecutive failed calls that open the circuit
+    'recovery_time': 30  # seconds before a trial request is let through
+}
+
+SPOOL_SETTINGS = {
+    'ram_dir': '/dev/shm/botsavex',  # used when it is writable and has room for the whole quota
+    'disk_dir': "/tmp" if os.getenv("RENDER") else DOWNLOAD_SETTINGS['temp_folder'],
+    'prefer_ram': os.getenv("SPOOL_PREFER_RAM", "1") == "1",
+    'quota': int(os.getenv("SPOOL_QUOTA_MB", "1024")) * 1024 * 1024,  # bytes reserved by downloads at once
+    'max_wait': 60,  # seconds a download waits for quota before giving up
+    'stale_after': 3600,  # seconds, older spool files are swept
+    'sweep_interval': 600
+}
+
+TRANSCODE_SETTINGS = {
+    'enabled': os.getenv("TRANSCODE_ENABLED", "1") == "1",  # only takes effect when ffmpeg is installed
+    'ffmpeg': os.getenv("FFMPEG_PATH", "ffmpeg"),
+    'ffprobe': os.getenv("FFPROBE_PATH", "ffprobe"),
+    'max_workers': int(os.getenv("TRANSCODE_WORKERS", "1")),  # CPU budget: concurrent ffmpeg processes
+    'timeout': int(os.getenv("TRANSCODE_TIMEOUT", "120")),  # seconds per ffmpeg job
+    'max_input_size': 200 * 1024 * 1024,  # 200MB, largest download worth transcoding down
+    'faststart': True  # remux every MP4 so the moov atom comes first
+}
+
+WORKER_SETTINGS = {
+    'mode': os.getenv("DEPLOY_MODE", "single"),  # single, or split: front process + worker.py processes
+    'queue_file': os.getenv("JOB_QUEUE_FILE", "jobs.db"),
+    'lease_seconds': 120,  # a job held by a dead worker is redelivered after this
+    'max_attempts': 3,
+    'poll_interval': 1.0  # seconds between queue polls when idle
+}
+
+FILE_CACHE_SETTINGS = {
+    'cache_file': os.getenv("FILE_CACHE_FILE", "file_cache.json"),
+    'max_size': 10000,
+    'ttl': 30 * 24 * 3600  # 30 days
+}
+
+DATABASE_SETTINGS = {
+    'db_file': os.getenv("DATABASE_FILE", "user_data.db"),
+    'json_file': 'user_data.json',  # migrated once into db_file
+    'flush_interval': 0.5,  # seconds
+    'cache_size': 10000  # users kept in the in-process LRU cache
+}
+
+BROADCAST_SETTINGS = {
+    'rate': 30,  # messages per second, Telegram's global bot limit
+    'concurrency': 20,
+    'max_retries': 5,
+    'checkpoint_file': 'broadcast_checkpoint.json'
+}
+
+WEBHOOK_SETTINGS = {
+    # "webhook" when WEBHOOK_URL is set, otherwise long polling
+    'mode': os.getenv("UPDATE_MODE", "webhook" if os.getenv("WEBHOOK_URL") else "polling"),
+    'url': os.getenv("WEBHOOK_URL", ""),
+    'listen': '0.0.0.0',
+    'port': int(os.getenv("PORT", "8080")),
+    'path': '/webhook',
+    'secret_token': os.getenv("WEBHOOK_SECRET", ""),
+    'max_connections': 40,
+    'concurrent_updates': int(os.getenv("CONCURRENT_UPDATES", "256"))
+}
+
+METRICS_SETTINGS = {
+    # /metrics is served on the webhook server; in polling mode a separate
+    # server is started when a port is given
+    'port': int(os.getenv("METRICS_PORT", "0"))
+}
@@ -1,55 +1,190 @@
 """
-Simple database module for storing user preferences
-In production, you should use a proper database like PostgreSQL or SQLite
+Database module for storing user preferences.
+Users live in a SQLite table (WAL mode) indexed by user id. Recently used
+users are kept in a bounded LRU cache that the setters write through.
+Writes are buffered in memory and committed in batches by a background
+thread on its own connection, so handlers never wait on the disk.
 """
 
+import atexit
 import json
 import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from config import DATABASE_SETTINGS
+from metrics import DB_WRITE_SECONDS, DB_WRITE_ROWS
 
-class SimpleDatabase:
-    def __init__(self, db_file: str = "user_data.json"):
+class SQLiteDatabase:
+    def __init__(self, db_file="user_data.db", json_file="user_data.json", flush_interval=0.5, batch_size=500, cache_size=10000):
         self.db_file = db_file
-        self.data = self._load_data()
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # user_id -> info, most recently used last
+        self._pending = {}  # user_id -> info waiting to be written
+        self._flushing = {}  # user_id -> info being written right now
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._conn = self._connect()
+        self._write_conn = self._connect()
+        self._create_schema()
+        self._migrate_json(json_file)
+        self._writer = threading.Thread(target=self._write_loop, name="db-writer", daemon=True)
+        self._writer.start()
 
-    def _load_data(self):
-        if os.path.exists(self.db_file):
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _create_schema(self):
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS users ("
+                "user_id INTEGER PRIMARY KEY, language TEXT, info TEXT NOT NULL DEFAULT '{}')"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def _migrate_json(self, json_file):
+        """One-time import of the old user_data.json store"""
+        if not json_file or not os.path.exists(json_file):
+            return
+        with self._lock:
+            done = self._conn.execute("SELECT value FROM meta WHERE key = 'json_migrated'").fetchone()
+            if done:
+                return
             try:
-                with open(self.db_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                with open(json_file, 'r', encoding='utf-8') as f:
+                    users = json.load(f).get("users", {})
             except Exception:
-                return {"users": {}}
-        return {"users": {}}
+                users = {}
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO users (user_id, language, info) VALUES (?, ?, ?)",
+                    [(int(user_id), info.get("language"), json.dumps(info, ensure_ascii=False))
+                     for user_id, info in users.items()]
+                )
+                self._conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', ?)", (json_file,))
+
+    def _read(self, user_id, fresh=False):
+        with self._lock:
+            # fresh skips the LRU for rows another process may have changed
+            info = None if fresh else self._cache.get(user_id)
+            if info is not None:
+                self._cache.move_to_end(user_id)
+                return info
+            info = self._pending.get(user_id) or self._flushing.get(user_id)
+            if info is None:
+                row = self._conn.execute("SELECT info FROM users WHERE user_id = ?", (user_id,)).fetchone()
+                info = json.loads(row[0]) if row else {}
+            self._cache_put(user_id, info)
+        return info
 
-    def _save_data(self):
-        with open(self.db_file, 'w', encoding='utf-8') as f:
-            json.dump(self.data, f, indent=2, ensure_ascii=False)
+    def _cache_put(self, user_id, info):
+        self._cache[user_id] = info
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
 
     def get_user_language(self, user_id):
-        return self.data.get("users", {}).get(str(user_id), {}).get("language", "uz")
+        return self._read(int(user_id)).get("language", "uz")
 
     def set_user_language(self, user_id, language):
-        if "users" not in self.data:
-            self.data["users"] = {}
-        if str(user_id) not in self.data["users"]:
-            self.data["users"][str(user_id)] = {}
-        self.data["users"][str(user_id)]["language"] = language
-        self._save_data()
+        self.set_user_info(user_id, {"language": language})
 
-    def get_user_info(self, user_id):
-        return self.data.get("users", {}).get(str(user_id), {})
+    def get_user_info(self, user_id, fresh=False):
+        return dict(self._read(int(user_id), fresh))
 
     def set_user_info(self, user_id, info):
-        if "users" not in self.data:
-            self.data["users"] = {}
-        if str(user_id) not in self.data["users"]:
-            self.data["users"][str(user_id)] = {}
-        self.data["users"][str(user_id)].update(info)
-        self._save_data()
+        user_id = int(user_id)
+        current = dict(self._read(user_id))
+        current.update(info)
+        with self._lock:
+            self._pending[user_id] = current
+            self._cache_put(user_id, current)
+            if len(self._pending) >= self.batch_size:
+                self._wakeup.set()
+
+    def count_users(self):
+        self.flush()
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def iter_users(self, start_after=0, batch_size=1000):
+        """Yield (user_id, info) ordered by user id, one page at a time"""
+        self.flush()
+        last_id = start_after
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT user_id, info FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                    (last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            for user_id, info in rows:
+                yield user_id, json.loads(info)
+            last_id = rows[-1][0]
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                self._flushing, self._pending = self._pending, {}
+            rows = [(user_id, info.get("language"), json.dumps(info, ensure_ascii=False))
+                    for user_id, info in self._flushing.items()]
+            try:
+                with DB_WRITE_SECONDS.time(), self._write_conn:
+                    self._write_conn.executemany(
+                        "INSERT INTO users (user_id, language, info) VALUES (?, ?, ?) "
+                        "ON CONFLICT(user_id) DO UPDATE SET language = excluded.language, info = excluded.info",
+                        rows
+                    )
+                DB_WRITE_ROWS.inc(len(rows))
+            except Exception:
+                with self._lock:
+                    # Keep the batch for the next attempt unless it was overwritten meanwhile
+                    for user_id, info in self._flushing.items():
+                        self._pending.setdefault(user_id, info)
+                raise
+            finally:
+                with self._lock:
+                    self._flushing = {}
+
+    def _write_loop(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print("Error writing user data:", e)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._wakeup.set()
+        self._writer.join()
+        self.flush()
+        self._write_conn.close()
+        self._conn.close()
 
-db = SimpleDatabase()
+db = SQLiteDatabase(
+    db_file=DATABASE_SETTINGS['db_file'],
+    json_file=DATABASE_SETTINGS['json_file'],
+    flush_interval=DATABASE_SETTINGS['flush_interval'],
+    cache_size=DATABASE_SETTINGS['cache_size']
+)
+atexit.register(db.close)
 
 def get_user_language(user_id):
     return db.get_user_language(user_id)
 
 def set_user_language(user_id, language):
-    db.set_user_language(user_id, language) 
\ No newline at end of file
+    db.set_user_language(user_id, language)
@@ -0,0 +1,95 @@
+"""
+Bounded download scheduler: a fixed pool of workers pulls jobs from
+per-user queues in round-robin order, so one user cannot starve others.
+"""
+
+import asyncio
+import logging
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+class QueueFullError(Exception):
+    pass
+
+class UserLimitError(Exception):
+    pass
+
+class DownloadScheduler:
+    def __init__(self, workers=4, max_queue_size=100, max_jobs_per_user=2):
+        self.workers = workers
+        self.max_queue_size = max_queue_size
+        self.max_jobs_per_user = max_jobs_per_user
+        self._queues = OrderedDict()  # user_id -> deque of pending jobs
+        self._active = {}  # user_id -> queued + running jobs
+        self._pending = 0
+        self._wakeup = None
+        self._tasks = []
+
+    @property
+    def pending(self):
+        return self._pending
+
+    @property
+    def running(self):
+        return sum(self._active.values()) - self._pending
+
+    def start(self):
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Condition()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, user_id, job):
+        """Queue a coroutine function and return its 1-based position in the queue"""
+        if self._pending >= self.max_queue_size:
+            raise QueueFullError()
+        if self._active.get(user_id, 0) >= self.max_jobs_per_user:
+            raise UserLimitError()
+        self._queues.setdefault(user_id, deque()).append(job)
+        self._active[user_id] = self._active.get(user_id, 0) + 1
+        self._pending += 1
+        position = self.position(job)
+        async with self._wakeup:
+            self._wakeup.notify()
+        return position
+
+    def position(self, job):
+        # Replays the round-robin order the workers will follow
+        queues = [list(q) for q in self._queues.values()]
+        position = 0
+        for depth in range(max((len(q) for q in queues), default=0)):
+            for q in queues:
+                if depth < len(q):
+                    position += 1
+                    if q[depth] is job:
+                        return position
+        return 0
+
+    def _next_job(self):
+        user_id, q = self._queues.popitem(last=False)
+        job = q.popleft()
+        if q:
+            self._queues[user_id] = q  # back of the rotation
+        self._pending -= 1
+        return user_id, job
+
+    async def _worker(self, index):
+        while True:
+            async with self._wakeup:
+                await self._wakeup.wait_for(lambda: self._pending > 0)
+                user_id, job = self._next_job()
+            try:
+                await job()
+            except Exception as e:
+                logger.error(f"Download worker {index} error: {e}")
+            finally:
+                self._active[user_id] -= 1
+                if not self._active[user_id]:
+                    del self._active[user_id]
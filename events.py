@@ -0,0 +1,244 @@
+"""
+Append-only usage event log. Handlers record one JSON line per handled
+message and download outcome; lines are buffered and appended in batches
+by a background thread, and the file rotates like a RotatingFileHandler.
+Rollups (totals, hourly buckets, users per language and a Space-Saving
+top-K of media ids) are updated as events are recorded and rebuilt from
+the log at startup, so /stats never scans the log. Processes sharing the
+log (the front and split-mode workers) also follow the lines the others
+append, so every process's rollups cover the whole deployment.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, run a single process there
+    fcntl = None
+from config import EVENT_LOG_SETTINGS
+
+class SpaceSaving:
+    """Approximate top-K counter in O(k) memory: counts may be overestimated by at most error"""
+    def __init__(self, k=100):
+        self.k = k
+        self.counts = {}  # item -> [count, error]
+
+    def add(self, item):
+        entry = self.counts.get(item)
+        if entry:
+            entry[0] += 1
+            return
+        if len(self.counts) < self.k:
+            self.counts[item] = [1, 0]
+            return
+        # Replace the least counted item and inherit its count as the error bound
+        victim = min(self.counts, key=lambda key: self.counts[key][0])
+        floor = self.counts.pop(victim)[0]
+        self.counts[item] = [floor + 1, floor]
+
+    def top(self, n=10):
+        ranked = sorted(self.counts.items(), key=lambda entry: entry[1][0], reverse=True)
+        return [(item, count, error) for item, (count, error) in ranked[:n]]
+
+class UsageStats:
+    def __init__(self, top_k=100, hours=168):
+        self.hours = hours
+        self.totals = {}  # (event, result) -> count
+        self.hourly = {}  # hour -> {(event, result): count}
+        self.user_languages = {}  # user_id -> language
+        self.language_users = {}  # language -> distinct users
+        self.top_media = SpaceSaving(top_k)
+        self.first_ts = None
+
+    def apply(self, event):
+        if self.first_ts is None:
+            self.first_ts = event['ts']
+        key = (event['event'], event.get('result'))
+        self.totals[key] = self.totals.get(key, 0) + 1
+        self._count_hour(int(event['ts'] // 3600), key)
+        user_id, language = event.get('user_id'), event.get('language')
+        if user_id is not None and language:
+            previous = self.user_languages.get(user_id)
+            if previous != language:
+                if previous:
+                    self.language_users[previous] -= 1
+                self.user_languages[user_id] = language
+                self.language_users[language] = self.language_users.get(language, 0) + 1
+        if event['event'] == 'download' and event.get('media'):
+            self.top_media.add(event['media'])
+
+    def _count_hour(self, hour, key):
+        bucket = self.hourly.get(hour)
+        if bucket is None:
+            # Events from several processes arrive slightly out of order, so
+            # buckets are pruned by hour rather than by insertion order
+            oldest = max(hour, max(self.hourly, default=hour)) - self.hours + 1
+            if hour < oldest:
+                return
+            bucket = self.hourly[hour] = {}
+            for stale in [h for h in self.hourly if h < oldest]:
+                del self.hourly[stale]
+        bucket[key] = bucket.get(key, 0) + 1
+
+    def count(self, event, result=None):
+        if result is not None:
+            return self.totals.get((event, result), 0)
+        return sum(count for (name, _), count in self.totals.items() if name == event)
+
+    def recent(self, event, hours=24):
+        """{result: count} for the last `hours` hourly buckets"""
+        now = int(time.time() // 3600)
+        results = {}
+        for hour in range(now - hours + 1, now + 1):
+            for (name, result), count in self.hourly.get(hour, {}).items():
+                if name == event:
+                    results[result] = results.get(result, 0) + count
+        return results
+
+class EventLog:
+    def __init__(self, log_file="events.jsonl", max_bytes=10 * 1024 * 1024, backups=5,
+                 flush_interval=1.0, batch_size=500, top_k=100, hours=168):
+        self.log_file = log_file
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.stats = UsageStats(top_k, hours)
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._position = (None, 0)  # (inode, offset) of the log read so far
+        self._rebuild()
+        self._writer = threading.Thread(target=self._write_loop, name="event-writer", daemon=True)
+        self._writer.start()
+
+    def _files(self):
+        """Log files oldest first"""
+        rotated = [f"{self.log_file}.{i}" for i in range(self.backups, 0, -1)]
+        return [path for path in rotated + [self.log_file] if os.path.exists(path)]
+
+    def _rebuild(self):
+        with self._file_lock():
+            self._follow(replay_all=True)
+
+    def _follow(self, replay_all=False):
+        """Apply lines appended since the last call, following rotations; call under the file lock"""
+        paths = self._files()
+        inodes = [os.stat(path).st_ino for path in paths]
+        inode, offset = self._position
+        if replay_all:
+            first, offset = 0, 0
+        elif inode in inodes:
+            first = inodes.index(inode)
+        elif self.log_file in paths:
+            first, offset = len(paths) - 1, 0
+        else:
+            return
+        for path, path_inode in zip(paths[first:], inodes[first:]):
+            self._position = (path_inode, self._replay(path, offset))
+            offset = 0
+
+    def _replay(self, path, offset):
+        """Apply every complete line of path after offset and return the new offset"""
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        with self._lock:
+            for line in data[:end].splitlines():
+                try:
+                    self.stats.apply(json.loads(line))
+                except (ValueError, KeyError, TypeError):
+                    continue  # a torn line from a crash
+        return offset + end
+
+    def record(self, event, **fields):
+        entry = {'ts': time.time(), 'event': event}
+        entry.update(fields)
+        with self._lock:
+            self.stats.apply(entry)
+            self._buffer.append(json.dumps(entry, ensure_ascii=False) + "\n")
+            if len(self._buffer) >= self.batch_size:
+                self._wakeup.set()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                lines, self._buffer = self._buffer, []
+            with self._file_lock():
+                # Pick up other processes' lines first; ours are already applied
+                self._follow()
+                if not lines:
+                    return
+                with open(self.log_file, 'ab') as f:
+                    f.write("".join(lines).encode('utf-8'))
+                    self._position = (os.fstat(f.fileno()).st_ino, f.tell())
+                # Checked under the lock, so only one process rotates a full file
+                if self._position[1] >= self.max_bytes:
+                    self._rotate()
+
+    @contextmanager
+    def _file_lock(self):
+        """Serialize appends and rotation across every process sharing the log"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.log_file + ".lock", 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            source = f"{self.log_file}.{i}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.log_file}.{i + 1}")
+        if self.backups:
+            os.replace(self.log_file, f"{self.log_file}.1")
+        else:
+            os.remove(self.log_file)
+
+    def summary(self, hours=24, top=5):
+        """Snapshot of the rollups for /stats, taken while the writer thread may be applying lines"""
+        with self._lock:
+            return {
+                'total': self.stats.count('download'),
+                'recent': self.stats.recent('download', hours),
+                'language_users': dict(self.stats.language_users),
+                'top_media': self.stats.top_media.top(top),
+            }
+
+    def _write_loop(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print("Error writing event log:", e)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._wakeup.set()
+        self._writer.join()
+        self.flush()
+
+events = EventLog(
+    log_file=EVENT_LOG_SETTINGS['log_file'],
+    max_bytes=EVENT_LOG_SETTINGS['max_bytes'],
+    backups=EVENT_LOG_SETTINGS['backups'],
+    flush_interval=EVENT_LOG_SETTINGS['flush_interval'],
+    top_k=EVENT_LOG_SETTINGS['top_k'],
+    hours=EVENT_LOG_SETTINGS['hours']
+)
+atexit.register(events.close)
@@ -0,0 +1,233 @@
+"""
+Per-platform extractor registry. Each extractor contributes a URL pattern,
+a canonical form of the link (tracking params such as igshid dropped) used
+as the cache key, and an incremental page parser that stops reading as
+soon as the media URL shows up.
+"""
+
+import html
+import json
+import re
+from resilience import UpstreamError
+
+class Link:
+    def __init__(self, extractor, media_id, canonical_url, kind=None):
+        self.extractor = extractor
+        self.media_id = media_id
+        self.canonical_url = canonical_url
+        self.kind = kind
+
+    @property
+    def platform(self):
+        return self.extractor.platform
+
+    @property
+    def key(self):
+        return f"{self.platform}:{self.media_id}"
+
+class MediaItem:
+    def __init__(self, url, kind='video'):
+        self.url = url
+        self.kind = kind  # 'video' or 'photo'
+
+class Extractor:
+    platform = None
+    supported = True
+    url_pattern = None  # named groups must be unique across all extractors
+    media_patterns = ()
+    overlap = 4096  # chars kept between chunks so a match can span them
+
+    def link(self, match):
+        raise NotImplementedError
+
+    def clean(self, media_url):
+        return media_url
+
+    def check_response(self, r):
+        """False for a page without media, UpstreamError when the upstream is struggling"""
+        if r.status_code == 429 or r.status_code >= 500:
+            retry_after = r.headers.get('Retry-After')
+            raise UpstreamError(r.status_code, retry_after=int(retry_after) if retry_after and retry_after.isdigit() else None)
+        return r.status_code == 200
+
+    async def extract(self, client, page_url):
+        """Stream the page and return the first media URL found, or None"""
+        async with client.stream("GET", page_url) as r:
+            if not self.check_response(r):
+                return None
+            tail = ""
+            async for text in r.aiter_text():
+                window = tail + text
+                for pattern in self.media_patterns:
+                    match = pattern.search(window)
+                    if match:
+                        # Leaving the block closes the response unread
+                        return self.clean(match.group(1))
+                tail = window[-self.overlap:]
+        return None
+
+    async def extract_media(self, client, link):
+        """Return every media item behind the link; single-item by default"""
+        media_url = await self.extract(client, link.canonical_url)
+        return [MediaItem(media_url)] if media_url else []
+
+class InstagramExtractor(Extractor):
+    platform = 'instagram'
+    url_pattern = r'instagram\.com/(?:[\w.]+/)?(?P<ig_kind>reels?|p|tv)/(?P<ig_shortcode>[\w-]+)'
+    media_patterns = (
+        re.compile(r'"video_url":"([^"]+)"'),
+        re.compile(r'<meta property="og:video" content="([^"]+)"'),
+    )
+    carousel_markers = ('"edge_sidecar_to_children":', '"carousel_media":')
+    max_list_size = 1024 * 1024  # chars buffered after a marker before giving up on decoding the list
+    decoder = json.JSONDecoder()
+
+    def link(self, match):
+        kind, shortcode = match.group('ig_kind', 'ig_shortcode')
+        if kind == 'reels':
+            kind = 'reel'
+        return Link(self, shortcode, f"https://www.instagram.com/{kind}/{shortcode}/", kind)
+
+    def clean(self, media_url):
+        # JSON escapes & as \u0026, the og:video attribute as &amp;
+        return html.unescape(media_url.replace('\\u0026', '&'))
+
+    def check_response(self, r):
+        # Anonymous traffic Instagram throttles is redirected to the login page
+        if r.url.path.startswith('/accounts/login'):
+            raise UpstreamError('login wall', retryable=False)
+        return super().check_response(r)
+
+    async def extract_media(self, client, link):
+        if link.kind != 'p':
+            return await super().extract_media(client, link)
+        # Posts may be carousels. Scan the chunks like extract() until a
+        # children list starts, then buffer from there until it decodes
+        pending = ""
+        in_list = False
+        async with client.stream("GET", link.canonical_url) as r:
+            if not self.check_response(r):
+                return []
+            async for text in r.aiter_text():
+                pending += text
+                while True:
+                    if in_list:
+                        items, end = self._parse_carousel(pending)
+                        if end is None and len(pending) <= self.max_list_size:
+                            break  # the list continues in the next chunk
+                        if items:
+                            return items
+                        # Not a carousel, or a list that never decodes: scan on past the marker
+                        pending, in_list = pending[end or 0:], False
+                    list_start, media_url = self._scan(pending)
+                    if media_url:
+                        return [MediaItem(media_url)]
+                    if list_start is None:
+                        pending = pending[-self.overlap:]
+                        break
+                    pending, in_list = pending[list_start:], True
+        if in_list:
+            # The page ended inside a list that never decoded
+            for pattern in self.media_patterns:
+                match = pattern.search(pending)
+                if match:
+                    return [MediaItem(self.clean(match.group(1)))]
+        return []
+
+    def _scan(self, text):
+        """(offset where a children list starts, None) or (None, media URL found ahead of any list)"""
+        found = [(text.find(marker), marker) for marker in self.carousel_markers]
+        found = [(start, marker) for start, marker in found if start >= 0]
+        start, marker = min(found) if found else (len(text), "")
+        # A post-level video URL ahead of the children list means a single video
+        for pattern in self.media_patterns:
+            match = pattern.search(text, 0, start)
+            if match:
+                return None, self.clean(match.group(1))
+        return (start + len(marker) if marker else None), None
+
+    def _parse_carousel(self, text):
+        """(items, end) for the JSON value text starts with, (None, None) while it is incomplete"""
+        offset = len(text) - len(text.lstrip())
+        try:
+            value, end = self.decoder.raw_decode(text, offset)
+        except ValueError:
+            return None, None
+        items = []
+        if isinstance(value, dict):
+            # GraphQL shape: {"edges": [{"node": {...}}]}
+            edges = value.get('edges')
+            for edge in edges if isinstance(edges, list) else []:
+                node = edge.get('node') if isinstance(edge, dict) else None
+                if isinstance(node, dict):
+                    items.append(MediaItem(node.get('video_url'), 'video') if node.get('is_video')
+                                 else MediaItem(node.get('display_url'), 'photo'))
+        elif isinstance(value, list):
+            for node in value:
+                if isinstance(node, dict):
+                    items.append(self._carousel_item(node))
+        # Anything else (e.g. "carousel_media":null on a single post) is not a carousel
+        return [item for item in items if item and item.url], end
+
+    def _carousel_item(self, node):
+        try:
+            if node.get('video_versions'):
+                return MediaItem(node['video_versions'][0]['url'], 'video')
+            if node.get('image_versions2', {}).get('candidates'):
+                return MediaItem(node['image_versions2']['candidates'][0]['url'], 'photo')
+        except (KeyError, IndexError, TypeError, AttributeError):
+            pass
+        return None
+
+class TikTokExtractor(Extractor):
+    platform = 'tiktok'
+    supported = False
+    # Anything else on tiktok.com still resolves, so users get the "not supported yet" reply
+    url_pattern = (r'(?:(?:www|m)\.)?tiktok\.com/@[\w.-]+/video/(?P<tt_video>\d+)'
+                   r'|(?:vm|vt)\.tiktok\.com/(?P<tt_short>\w+)'
+                   r'|(?:(?:www|m)\.)?tiktok\.com/t/(?P<tt_t>\w+)'
+                   r'|tiktok\.com(?P<tt_page>/[^\s?#]*)?')
+
+    def link(self, match):
+        video_id = match.group('tt_video')
+        if video_id:
+            return Link(self, video_id, f"https://www.tiktok.com/@_/video/{video_id}")
+        short_id = match.group('tt_short')
+        if short_id:
+            return Link(self, short_id, f"https://vm.tiktok.com/{short_id}/")
+        short_id = match.group('tt_t')
+        if short_id:
+            return Link(self, short_id, f"https://www.tiktok.com/t/{short_id}/")
+        path = match.group('tt_page') or '/'
+        return Link(self, path, f"https://www.tiktok.com{path}")
+
+class ExtractorRegistry:
+    def __init__(self):
+        self.extractors = {}
+        self._pattern = None
+
+    def register(self, extractor):
+        self.extractors[extractor.platform] = extractor
+        self._pattern = None
+
+    @property
+    def pattern(self):
+        # One alternation of every platform, so dispatch is a single search
+        if self._pattern is None:
+            self._pattern = re.compile("|".join(
+                f"(?P<{platform}>{extractor.url_pattern})"
+                for platform, extractor in self.extractors.items()
+            ))
+        return self._pattern
+
+    def match(self, url):
+        match = self.pattern.search(url)
+        if not match:
+            return None
+        # The outer per-platform group closes last, so it is lastgroup
+        return self.extractors[match.lastgroup].link(match)
+
+registry = ExtractorRegistry()
+registry.register(InstagramExtractor())
+registry.register(TikTokExtractor())
+
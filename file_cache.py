@@ -0,0 +1,95 @@
+"""
+Cache of Telegram file_ids keyed by the link's media id (e.g. the
+Instagram shortcode), so a repeated link is answered by re-sending the
+already uploaded video. In split mode the front and worker processes share
+the file: entries written by the others are merged in when it changes.
+"""
+
+import json
+import os
+import time
+from collections import OrderedDict
+
+class FileIdCache:
+    def __init__(self, cache_file="file_cache.json", max_size=10000, ttl=30 * 24 * 3600, save_every=20):
+        self.cache_file = cache_file
+        self.max_size = max_size
+        self.ttl = ttl
+        self.save_every = save_every
+        self.hits = 0
+        self.misses = 0
+        self._dirty = 0
+        self._mtime = None
+        self.data = self._load_data()
+
+    def _load_data(self):
+        data = OrderedDict()
+        if os.path.exists(self.cache_file):
+            try:
+                self._mtime = os.path.getmtime(self.cache_file)
+                with open(self.cache_file, 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+                now = time.time()
+                for key, file_id, expires in entries:
+                    if expires > now:
+                        data[key] = (file_id, expires)
+            except Exception:
+                return OrderedDict()
+        return data
+
+    def refresh(self):
+        """Merge in entries another process saved since we last looked"""
+        try:
+            mtime = os.path.getmtime(self.cache_file)
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        for key, entry in self._load_data().items():
+            if key not in self.data:
+                # Unknown to us, so treat it as least recently used
+                self.data[key] = entry
+                self.data.move_to_end(key, last=False)
+        while len(self.data) > self.max_size:
+            self.data.popitem(last=False)
+
+    def save(self):
+        self.refresh()
+        tmp_file = f"{self.cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump([[key, file_id, expires] for key, (file_id, expires) in self.data.items()], f)
+        os.replace(tmp_file, self.cache_file)
+        self._mtime = os.path.getmtime(self.cache_file)
+        self._dirty = 0
+
+    def get(self, key):
+        entry = self.data.get(key)
+        if entry and entry[1] > time.time():
+            self.data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        if entry:
+            del self.data[key]
+        else:
+            self.refresh()
+            if key in self.data:
+                return self.get(key)
+        self.misses += 1
+        return None
+
+    def set(self, key, file_id):
+        self.data[key] = (file_id, time.time() + self.ttl)
+        self.data.move_to_end(key)
+        while len(self.data) > self.max_size:
+            self.data.popitem(last=False)
+        self._dirty += 1
+        if self._dirty >= self.save_every:
+            self.save()
+
+    def delete(self, key):
+        if self.data.pop(key, None):
+            self._dirty += 1
+
+    def close(self):
+        if self._dirty:
+            self.save()
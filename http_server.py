@@ -0,0 +1,122 @@
+"""
+Minimal asyncio HTTP/1.1 server for the webhook, health and metrics
+endpoints. Supports keep-alive and Content-Length bodies, which is all
+Telegram and Prometheus need, without pulling in a web framework.
+"""
+
+import asyncio
+import json
+import logging
+from urllib.parse import urlsplit, parse_qs
+
+logger = logging.getLogger(__name__)
+
+REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+           405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+class Request:
+    def __init__(self, method, target, headers, body):
+        parts = urlsplit(target)
+        self.method = method
+        self.path = parts.path
+        self.query = parse_qs(parts.query)
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+class Response:
+    def __init__(self, body=b"", status=200, content_type="text/plain; charset=utf-8", headers=None):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.body = body
+        self.status = status
+        self.content_type = content_type
+        self.headers = headers or {}
+
+def json_response(data, status=200):
+    return Response(json.dumps(data, ensure_ascii=False), status, "application/json")
+
+class HTTPServer:
+    def __init__(self, host="0.0.0.0", port=8080, max_body_size=1024 * 1024, idle_timeout=60):
+        self.host = host
+        self.port = port
+        self.max_body_size = max_body_size
+        # Idle keep-alive connections and clients that send a request too
+        # slowly are dropped, so they cannot pile up on a public port
+        self.idle_timeout = idle_timeout
+        self.routes = {}  # (method, path) -> async handler(request) -> Response
+        self.fallback = None  # handler for requests no route matches
+        self._server = None
+
+    def route(self, method, path, handler):
+        self.routes[(method, path)] = handler
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        if not self.port:
+            self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                head = await asyncio.wait_for(self._read_head(reader), self.idle_timeout)
+                if head is None:
+                    break
+                method, target, version, headers = head
+                length = int(headers.get("content-length", 0))
+                if length > self.max_body_size:
+                    await self._write(writer, Response("Payload too large", 413), close=True)
+                    break
+                body = await asyncio.wait_for(reader.readexactly(length), self.idle_timeout) if length else b""
+                response = await self._dispatch(Request(method, target, headers, body))
+                close = headers.get("connection", "").lower() == "close" or version == "HTTP/1.0"
+                await self._write(writer, response, close)
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_head(self, reader):
+        """(method, target, version, headers) of the next request, None once the client is done"""
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        method, target, version = request_line.decode('latin-1').split()
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode('latin-1').partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return method, target, version, headers
+
+    async def _dispatch(self, request):
+        handler = self.routes.get((request.method, request.path)) or self.fallback
+        if handler is None:
+            allowed = any(path == request.path for _, path in self.routes)
+            return Response("Method not allowed", 405) if allowed else Response("Not found", 404)
+        try:
+            return await handler(request)
+        except Exception as e:
+            logger.error(f"HTTP handler error on {request.path}: {e}")
+            return Response("Internal server error", 500)
+
+    async def _write(self, writer, response, close):
+        head = [f"HTTP/1.1 {response.status} {REASONS.get(response.status, 'OK')}",
+                f"Content-Type: {response.content_type}",
+                f"Content-Length: {len(response.body)}",
+                f"Connection: {'close' if close else 'keep-alive'}"]
+        head += [f"{name}: {value}" for name, value in response.headers.items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode('latin-1') + response.body)
+        await asyncio.wait_for(writer.drain(), self.idle_timeout)
@@ -0,0 +1,156 @@
+"""
+Durable download queue shared by the front process and the download
+workers (split deployment). Jobs live in a SQLite table; a worker leases a
+job for a limited time and renews the lease while it runs, so a job held
+by a crashed worker becomes visible again once the lease expires.
+"""
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from download_queue import QueueFullError, UserLimitError
+
+class JobQueue:
+    def __init__(self, db_file="jobs.db", lease_seconds=120, max_attempts=3):
+        self.db_file = db_file
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self.cached_counts = {}  # status -> jobs, refreshed off the event loop by start()
+        self._refresher = None
+        # Autocommit, so each method can open its own BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(db_file, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, payload TEXT NOT NULL, "
+            "status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, lease_until REAL, worker TEXT, "
+            "created REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)")
+
+    def _transaction(self, work):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def reserve(self, user_id, payload, max_queue_size=None, max_jobs_per_user=None):
+        """Add a held job and return (job_id, position); publish() makes it visible to workers"""
+        def work(conn):
+            waiting = conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('held', 'pending')").fetchone()[0]
+            if max_queue_size and waiting >= max_queue_size:
+                raise QueueFullError()
+            active = conn.execute("SELECT COUNT(*) FROM jobs WHERE user_id = ?", (user_id,)).fetchone()[0]
+            if max_jobs_per_user and active >= max_jobs_per_user:
+                raise UserLimitError()
+            cursor = conn.execute(
+                "INSERT INTO jobs (user_id, payload, status, created) VALUES (?, ?, 'held', ?)",
+                (user_id, json.dumps(payload), time.time())
+            )
+            return cursor.lastrowid, waiting + 1
+        return self._transaction(work)
+
+    def publish(self, job_id, **fields):
+        def work(conn):
+            row = conn.execute("SELECT payload FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row:
+                payload = json.loads(row[0])
+                payload.update(fields)
+                conn.execute("UPDATE jobs SET payload = ?, status = 'pending' WHERE id = ?",
+                             (json.dumps(payload), job_id))
+        self._transaction(work)
+
+    def lease(self, worker):
+        """Take the oldest pending, failed or expired job, return (job_id, payload, attempt) or None
+
+        A job that kept killing its worker is marked failed and handed out once
+        more with attempt > max_attempts, so a worker can tell the user instead
+        of running it again.
+        """
+        def work(conn):
+            now = time.time()
+            # A failed job whose failure report died too is dropped, and so are
+            # held jobs whose front process died before publishing
+            conn.execute("DELETE FROM jobs WHERE status = 'leased' AND lease_until < ? AND attempts > ?",
+                         (now, self.max_attempts))
+            conn.execute("UPDATE jobs SET status = 'failed' WHERE status = 'leased' AND lease_until < ? AND attempts >= ?",
+                         (now, self.max_attempts))
+            conn.execute("DELETE FROM jobs WHERE status = 'held' AND created < ?", (now - self.lease_seconds,))
+            row = conn.execute(
+                "SELECT id, payload, attempts FROM jobs WHERE status IN ('pending', 'failed') "
+                "OR (status = 'leased' AND lease_until < ?) ORDER BY id LIMIT 1",
+                (now,)
+            ).fetchone()
+            if not row:
+                return None
+            job_id, payload, attempts = row
+            conn.execute(
+                "UPDATE jobs SET status = 'leased', attempts = ?, lease_until = ?, worker = ? WHERE id = ?",
+                (attempts + 1, now + self.lease_seconds, worker, job_id)
+            )
+            return job_id, json.loads(payload), attempts + 1
+        return self._transaction(work)
+
+    def renew(self, job_id, worker):
+        """Extend a lease; False if the job was taken over by another worker"""
+        def work(conn):
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                (time.time() + self.lease_seconds, job_id, worker)
+            )
+            return cursor.rowcount == 1
+        return self._transaction(work)
+
+    def release(self, job_id, worker):
+        """Hand a leased job back without counting the attempt, e.g. on shutdown"""
+        self._transaction(lambda conn: conn.execute(
+            "UPDATE jobs SET status = 'pending', attempts = MAX(attempts - 1, 0), lease_until = NULL, worker = NULL "
+            "WHERE id = ? AND worker = ? AND status = 'leased'", (job_id, worker)
+        ))
+
+    def complete(self, job_id, worker):
+        """Delete a finished job, unless its lease lapsed and another worker took it over"""
+        def work(conn):
+            cursor = conn.execute("DELETE FROM jobs WHERE id = ? AND worker = ?", (job_id, worker))
+            return cursor.rowcount == 1
+        return self._transaction(work)
+
+    def discard(self, job_id):
+        """Drop a held job the front could not announce"""
+        self._transaction(lambda conn: conn.execute("DELETE FROM jobs WHERE id = ? AND status = 'held'", (job_id,)))
+
+    def counts(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    def start(self, interval=1.0):
+        if self._refresher is None:
+            self._refresher = asyncio.create_task(self._refresh_loop(interval))
+
+    async def stop(self):
+        if self._refresher:
+            self._refresher.cancel()
+            await asyncio.gather(self._refresher, return_exceptions=True)
+            self._refresher = None
+
+    async def _refresh_loop(self, interval):
+        while True:
+            try:
+                self.cached_counts = await asyncio.to_thread(self.counts)
+            except sqlite3.Error as e:
+                print("Error reading job queue counts:", e)
+            await asyncio.sleep(interval)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
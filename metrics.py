@@ -0,0 +1,184 @@
+"""
+In-process metrics (counters, gauges, histograms) rendered in the
+Prometheus text format. Updates are a dict lookup and an add under a
+lock, cheap enough to leave on in production.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REGISTRY = []
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        return lines + self._samples()
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation):
+        super().__init__(name, documentation)
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(_label_key(labels), 0)
+
+    def _samples(self):
+        return [f"{self.name}{_format_labels(key)} {value}" for key, value in self.values.items()]
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, function=None):
+        super().__init__(name, documentation)
+        self.function = function  # evaluated at scrape time when set
+        self.values = {}
+
+    def set(self, value, **labels):
+        self.values[_label_key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels):
+        if self.function:
+            return self.function()
+        return self.values.get(_label_key(labels), 0)
+
+    def track(self, **labels):
+        return _GaugeTracker(self, labels)
+
+    def _samples(self):
+        if self.function:
+            return [f"{self.name} {self.function()}"]
+        return [f"{self.name}{_format_labels(key)} {value}" for key, value in self.values.items()]
+
+class _GaugeTracker:
+    def __init__(self, gauge, labels):
+        self.gauge = gauge
+        self.labels = labels
+
+    def __enter__(self):
+        self.gauge.inc(**self.labels)
+
+    def __exit__(self, *exc):
+        self.gauge.dec(**self.labels)
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(buckets)
+        self.values = {}  # label key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            data = self.values.get(key)
+            if data is None:
+                data = self.values[key] = [0] * (len(self.buckets) + 3)
+            data[index] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def count(self, **labels):
+        data = self.values.get(_label_key(labels))
+        return data[-1] if data else 0
+
+    def quantile(self, q, **labels):
+        """Estimate a quantile by interpolating inside the matching bucket"""
+        data = self.values.get(_label_key(labels))
+        if not data or not data[-1]:
+            return None
+        rank = q * data[-1]
+        seen = 0
+        lower = 0
+        for index, upper in enumerate(self.buckets):
+            if seen + data[index] >= rank:
+                fraction = (rank - seen) / data[index] if data[index] else 0
+                return lower + (upper - lower) * fraction
+            seen += data[index]
+            lower = upper
+        return self.buckets[-1]
+
+    def _samples(self):
+        lines = []
+        for key, data in self.values.items():
+            cumulative = 0
+            for index, upper in enumerate(self.buckets):
+                cumulative += data[index]
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', upper)])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {data[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {data[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {data[-1]}")
+        return lines
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+REQUESTS = Counter("botsavex_requests_total", "Handled links by platform and result")
+EXTRACT_SECONDS = Histogram("botsavex_extract_seconds", "Time spent in VideoDownloader.get_video_url")
+DOWNLOAD_SECONDS = Histogram("botsavex_download_seconds", "Time spent downloading videos from the CDN")
+DOWNLOAD_BYTES = Counter("botsavex_download_bytes_total", "Bytes downloaded from the CDN")
+UPLOAD_SECONDS = Histogram("botsavex_upload_seconds", "Time spent in send_video")
+DB_WRITE_SECONDS = Histogram("botsavex_db_write_seconds", "Time spent committing user data batches")
+DB_WRITE_ROWS = Counter("botsavex_db_write_rows_total", "User rows written to the database")
+DOWNLOADS_IN_FLIGHT = Gauge("botsavex_downloads_in_flight", "Downloads currently running")
+TRANSCODE_SECONDS = Histogram("botsavex_transcode_seconds", "Wall time of ffmpeg jobs by op")
+TRANSCODE_CPU_SECONDS = Counter("botsavex_transcode_cpu_seconds_total", "CPU time spent in ffmpeg by op")
+TRANSCODE_BYTES_SAVED = Counter("botsavex_transcode_bytes_saved_total", "Bytes removed from videos by ffmpeg")
+TRANSCODE_JOBS = Counter("botsavex_transcode_jobs_total", "ffmpeg jobs by op and result")
+UPSTREAM_CALLS = Counter("botsavex_upstream_calls_total", "Upstream page fetches by host and outcome")
+UPSTREAM_HEDGES = Counter("botsavex_upstream_hedges_total", "Hedged duplicate page requests by host")
+UPSTREAM_RETRIES = Counter("botsavex_upstream_retries_total", "Retried page requests by host")
@@ -0,0 +1,210 @@
+"""
+Resilience for upstream page fetches: per-host latency tracking, a hedged
+second request once a call runs past the host's p95, bounded retries with
+jittered backoff on 429/5xx, and a circuit breaker that fails fast while
+the host keeps failing instead of piling more requests onto it.
+"""
+
+import asyncio
+import random
+import time
+from collections import deque
+import httpx
+from metrics import UPSTREAM_CALLS, UPSTREAM_HEDGES, UPSTREAM_RETRIES
+
+class UpstreamError(Exception):
+    """Failure worth retrying (429/5xx), or a login wall when retryable is False"""
+    def __init__(self, status, retryable=True, retry_after=None):
+        super().__init__(f"upstream returned {status}")
+        self.status = status
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+class CircuitOpenError(Exception):
+    pass
+
+class LatencyTracker:
+    def __init__(self, window=200, min_samples=20):
+        self.min_samples = min_samples
+        self.samples = deque(maxlen=window)
+
+    def observe(self, seconds):
+        self.samples.append(seconds)
+
+    def quantile(self, q):
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class CircuitBreaker:
+    """closed -> open after failure_threshold failures in a row -> half-open trial after recovery_time"""
+    def __init__(self, failure_threshold=5, recovery_time=30):
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.failures = 0
+        self.opened_at = None
+        self.open_for = recovery_time  # how long the current opening lasts before a probe
+        self.trial = None  # set while the half-open probe runs, then fired with its outcome
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.open_for:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        state = self.state
+        if state == 'closed':
+            return True
+        if state == 'half-open' and self.trial is None:
+            # Let a single request through to probe the upstream
+            self.trial = asyncio.Event()
+            return True
+        return False
+
+    def end_trial(self):
+        if self.trial is not None:
+            self.trial.set()
+            self.trial = None
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.end_trial()
+
+    def record_failure(self, retry_after=None):
+        self.failures += 1
+        self.end_trial()
+        if retry_after:
+            # The upstream said when to come back: stay open until then
+            self.opened_at = time.monotonic()
+            self.open_for = retry_after
+        elif self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self.open_for = self.recovery_time
+
+class UpstreamGuard:
+    def __init__(self, settings):
+        self.settings = settings
+        self.attempt_timeout = settings['attempt_timeout']
+        self.max_retries = settings['max_retries']
+        self.latency = {}  # host -> LatencyTracker
+        self.breakers = {}  # host -> CircuitBreaker
+        self.calls = 0
+        self.hedges = 0
+
+    def tracker(self, host):
+        if host not in self.latency:
+            self.latency[host] = LatencyTracker(self.settings['latency_window'], self.settings['hedge_min_samples'])
+        return self.latency[host]
+
+    def breaker(self, host):
+        if host not in self.breakers:
+            self.breakers[host] = CircuitBreaker(self.settings['failure_threshold'], self.settings['recovery_time'])
+        return self.breakers[host]
+
+    def available(self, host):
+        """Whether a new link for host is worth accepting right now"""
+        breaker = self.breaker(host)
+        state = breaker.state
+        return state == 'closed' or (state == 'half-open' and breaker.trial is None)
+
+    @property
+    def open_circuits(self):
+        return sum(1 for breaker in self.breakers.values() if breaker.state != 'closed')
+
+    async def call(self, host, fetch, timeout=None):
+        """Run fetch() (a coroutine function) against host with hedging, retries and the breaker
+
+        Attempts and backoff sleeps share the timeout budget, so running out
+        of time counts against the breaker like any other failed attempt. A
+        Retry-After the budget or backoff_max cannot wait out fails the call
+        and holds the circuit open until then.
+        """
+        breaker = self.breaker(host)
+        deadline = time.monotonic() + timeout if timeout else None
+        while not breaker.allow():
+            if breaker.trial is None:
+                UPSTREAM_CALLS.inc(host=host, outcome='rejected')
+                raise CircuitOpenError(host)
+            # Links accepted just before the probe started wait for its verdict
+            await asyncio.wait_for(breaker.trial.wait(), deadline - time.monotonic() if deadline else None)
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = await self._hedged(host, fetch, deadline)
+            except asyncio.CancelledError:
+                breaker.end_trial()
+                raise
+            except (UpstreamError, httpx.TransportError, asyncio.TimeoutError, OSError) as e:
+                retryable = getattr(e, 'retryable', True)
+                retry_after = getattr(e, 'retry_after', None)
+                delay = self._backoff(attempt, retry_after)
+                out_of_time = deadline is not None and time.monotonic() + delay >= deadline
+                # Retrying before Retry-After would only add to the throttling
+                throttled = retry_after is not None and retry_after > self.settings['backoff_max']
+                if not retryable or attempt == self.max_retries or out_of_time or throttled:
+                    breaker.record_failure(retry_after if throttled or out_of_time else None)
+                    UPSTREAM_CALLS.inc(host=host, outcome='error')
+                    raise
+                UPSTREAM_RETRIES.inc(host=host)
+                await asyncio.sleep(delay)
+                continue
+            except Exception:
+                # Parser errors and the like say nothing about upstream health
+                breaker.end_trial()
+                raise
+            breaker.record_success()
+            UPSTREAM_CALLS.inc(host=host, outcome='success')
+            return result
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after:
+            return retry_after
+        # Full jitter keeps retries from many users from arriving in lockstep
+        return random.uniform(0, min(self.settings['backoff_max'], self.settings['backoff_base'] * 2 ** attempt))
+
+    async def _timed(self, host, fetch, deadline=None):
+        timeout = self.attempt_timeout
+        if deadline is not None:
+            timeout = min(timeout, max(deadline - time.monotonic(), 0))
+        started = time.monotonic()
+        result = await asyncio.wait_for(fetch(), timeout)
+        self.tracker(host).observe(time.monotonic() - started)
+        return result
+
+    def _hedge_delay(self, host):
+        if not self.settings['hedge']:
+            return None
+        # Hedges are capped at a fraction of calls so a slow upstream does not get double traffic
+        if self.hedges >= self.settings['hedge_ratio'] * self.calls:
+            return None
+        return self.tracker(host).quantile(0.95)
+
+    async def _hedged(self, host, fetch, deadline=None):
+        self.calls += 1
+        delay = self._hedge_delay(host)
+        if delay is None:
+            return await self._timed(host, fetch, deadline)
+        tasks = [asyncio.ensure_future(self._timed(host, fetch, deadline))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self.hedges += 1
+                UPSTREAM_HEDGES.inc(host=host)
+                tasks.append(asyncio.ensure_future(self._timed(host, fetch, deadline)))
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # The slower of the two is abandoned, which closes its connection
+            for task in tasks:
+                task.cancel()
@@ -1,17 +1,20 @@
 import asyncio
-import requests
-from config import BOT_TOKEN, ADMIN_ID
+import hashlib
+import json
+import os
+import random
+import time
+import httpx
+from config import BOT_TOKEN, BROADCAST_SETTINGS
 from database import db
 
-async def send_broadcast():
-    """Send broadcast message to all users"""
-    broadcast_text = """🎉 Bot yangilandi va ishga tushdi!
+BROADCAST_TEXT = """🎉 Bot yangilandi va ishga tushdi!
 
 📱 Instagram va TikTok videolarini yuklab olish uchun havola yuboring.
 
 🌐 3 tilda qo'llab-quvvatlash:
 🇺🇿 O'zbekcha
-🇬🇧 English  
+🇬🇧 English
 🇷🇺 Русский
 
 💡 Komandalar:
@@ -23,44 +26,171 @@ async def send_broadcast():
 
 ✅ Endi bot to'liq ishlayapti!"""
 
-    try:
-        all_users = db.get_all_users()
-        success_count = 0
-        error_count = 0
-        
-        print(f"📢 {len(all_users)} foydalanuvchiga xabar yuborilmoqda...")
-        
-        for user_id_str in all_users.keys():
+class TokenBucket:
+    """Global send rate limiter shared by all senders"""
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class Broadcast:
+    def __init__(self, text, rate=30, concurrency=20, max_retries=5, checkpoint_file="broadcast_checkpoint.json"):
+        self.text = text
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.checkpoint_file = checkpoint_file
+        self.bucket = TokenBucket(rate)
+        self.text_hash = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        self.stats = {'sent': 0, 'failed': 0, 'blocked': 0}
+        self.start_after = 0
+        self.last_dispatched = 0
+        self._inflight = {}  # user ids in dispatch (= ascending) order
+        self._client = None
+
+    def _load_checkpoint(self):
+        if not os.path.exists(self.checkpoint_file):
+            return
+        try:
+            with open(self.checkpoint_file, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+        except Exception:
+            return
+        if checkpoint.get('text_hash') == self.text_hash:
+            self.start_after = checkpoint['last_user_id']
+            self.stats.update(checkpoint['stats'])
+            print(f"♻️ Broadcast {self.start_after} dan davom ettirilmoqda")
+
+    def _save_checkpoint(self):
+        # Every user up to the oldest one still in flight has been handled
+        if self._inflight:
+            last_user_id = next(iter(self._inflight)) - 1
+        else:
+            last_user_id = self.last_dispatched
+        tmp_file = self.checkpoint_file + ".tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({'text_hash': self.text_hash, 'last_user_id': last_user_id, 'stats': self.stats}, f)
+        os.replace(tmp_file, self.checkpoint_file)
+
+    async def _send(self, user_id):
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
             try:
-                user_id = int(user_id_str)
-                response = requests.post(
-                    f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage",
-                    json={
-                        "chat_id": user_id,
-                        "text": broadcast_text,
-                        "parse_mode": "HTML"
-                    }
+                response = await self._client.post(
+                    "sendMessage",
+                    json={"chat_id": user_id, "text": self.text, "parse_mode": "HTML"}
                 )
-                
-                if response.status_code == 200:
-                    success_count += 1
-                    print(f"✅ {user_id} ga yuborildi")
-                else:
-                    error_count += 1
-                    print(f"❌ {user_id} ga yuborilmadi: {response.status_code}")
-                
-                await asyncio.sleep(0.1)  # Rate limiting
-                
+            except httpx.HTTPError:
+                await asyncio.sleep(min(30, 2 ** attempt) * random.uniform(0.5, 1.5))
+                continue
+            if response.status_code == 200:
+                return 'sent'
+            try:
+                result = response.json()
+            except ValueError:
+                result = {}
+            if response.status_code == 429:
+                self.bucket.pause(result.get('parameters', {}).get('retry_after', 1))
+                continue
+            if response.status_code == 403 or 'chat not found' in result.get('description', ''):
+                # Bot blocked, user deactivated or chat gone
+                return 'blocked'
+            if response.status_code >= 500:
+                await asyncio.sleep(min(30, 2 ** attempt) * random.uniform(0.5, 1.5))
+                continue
+            return 'failed'
+        return 'failed'
+
+    async def _sender(self, queue):
+        while True:
+            user_id = await queue.get()
+            try:
+                result = await self._send(user_id)
+                self.stats[result] += 1
+                if result == 'blocked':
+                    db.set_user_info(user_id, {'blocked': True})
             except Exception as e:
-                error_count += 1
-                print(f"❌ {user_id_str} xatoligi: {e}")
-        
+                self.stats['failed'] += 1
+                print(f"❌ {user_id} xatoligi: {e}")
+            finally:
+                del self._inflight[user_id]
+                queue.task_done()
+
+    async def _report(self, total):
+        started = time.monotonic()
+        done_at_start = sum(self.stats.values())
+        while True:
+            await asyncio.sleep(5)
+            self._save_checkpoint()
+            done = sum(self.stats.values())
+            rate = (done - done_at_start) / (time.monotonic() - started)
+            eta = (total - done) / rate if rate else 0
+            print(f"📊 {done}/{total} | ✅ {self.stats['sent']} ❌ {self.stats['failed']} "
+                  f"🚫 {self.stats['blocked']} | {rate:.1f} msg/s | ETA {eta / 60:.1f} min")
+
+    async def run(self):
+        self._load_checkpoint()
+        total = await asyncio.to_thread(db.count_users)
+        print(f"📢 {total} foydalanuvchiga xabar yuborilmoqda...")
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        async with httpx.AsyncClient(
+            base_url=f"https://api.telegram.org/bot{BOT_TOKEN}/",
+            timeout=30,
+            limits=httpx.Limits(max_connections=self.concurrency)
+        ) as self._client:
+            senders = [asyncio.create_task(self._sender(queue)) for _ in range(self.concurrency)]
+            reporter = asyncio.create_task(self._report(total))
+            try:
+                for user_id, info in db.iter_users(start_after=self.start_after):
+                    if info.get('blocked'):
+                        continue
+                    self._inflight[user_id] = True
+                    self.last_dispatched = user_id
+                    await queue.put(user_id)
+                await queue.join()
+            finally:
+                for task in senders + [reporter]:
+                    task.cancel()
+                await asyncio.gather(*senders, reporter, return_exceptions=True)
+                self._save_checkpoint()
+        os.remove(self.checkpoint_file)
         print(f"\n📊 Natija:")
-        print(f"✅ Muvaffaqiyat: {success_count}")
-        print(f"❌ Xatolik: {error_count}")
-        
+        print(f"✅ Muvaffaqiyat: {self.stats['sent']}")
+        print(f"❌ Xatolik: {self.stats['failed']}")
+        print(f"🚫 Bloklangan: {self.stats['blocked']}")
+
+async def send_broadcast():
+    """Send broadcast message to all users"""
+    try:
+        await Broadcast(
+            BROADCAST_TEXT,
+            rate=BROADCAST_SETTINGS['rate'],
+            concurrency=BROADCAST_SETTINGS['concurrency'],
+            max_retries=BROADCAST_SETTINGS['max_retries'],
+            checkpoint_file=BROADCAST_SETTINGS['checkpoint_file']
+        ).run()
     except Exception as e:
         print(f"❌ Broadcast xatoligi: {e}")
 
 if __name__ == "__main__":
-    asyncio.run(send_broadcast()) 
\ No newline at end of file
+    asyncio.run(send_broadcast())
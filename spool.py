@@ -0,0 +1,183 @@
+"""
+Spool manager for downloaded media. Every download reserves bytes against
+a shared quota before it starts and waits (up to max_wait) when the quota
+is taken. Files are created through a Spool handle that removes them on
+exit, in RAM-backed /dev/shm when it has room, and a periodic sweep deletes
+files left behind by a crashed process.
+"""
+
+import asyncio
+import os
+import time
+import uuid
+
+PREFIX = "video_"
+
+class SpoolFullError(Exception):
+    pass
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class Spool:
+    """Reservation held by one download job; use as an async context manager"""
+    def __init__(self, manager):
+        self.manager = manager
+        self.reserved = 0
+        self.paths = []
+        self.closed = False
+
+    def _check_open(self):
+        if self.closed:
+            raise RuntimeError("spool is closed")
+
+    def path(self, extension="mp4"):
+        self._check_open()
+        filename = os.path.join(self.manager.directory, f"{PREFIX}{os.getpid()}_{uuid.uuid4().hex[:8]}.{extension}")
+        self.paths.append(filename)
+        self.manager.live_paths.add(filename)
+        return filename
+
+    def track(self, filename):
+        """Register a file created from one of ours, e.g. by ffmpeg"""
+        if filename not in self.paths:
+            self.paths.append(filename)
+            self.manager.live_paths.add(filename)
+
+    async def extend(self, size):
+        self._check_open()
+        await self.manager._acquire(size)
+        if self.closed:
+            # Closed while waiting for room: the bytes have no owner to release them
+            await self.manager._release(size)
+            self._check_open()
+        self.reserved += size
+
+    async def release(self, size):
+        size = min(size, self.reserved)
+        self.reserved -= size
+        await self.manager._release(size)
+
+    async def close(self):
+        self.closed = True
+        for filename in self.paths:
+            self.manager.live_paths.discard(filename)
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+        self.paths = []
+        await self.release(self.reserved)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+class SpoolManager:
+    def __init__(self, settings):
+        self.quota = settings['quota']
+        self.max_wait = settings['max_wait']
+        self.stale_after = settings['stale_after']
+        self.sweep_interval = settings['sweep_interval']
+        self.directory = self._pick_directory(settings)
+        self.reserved = 0
+        self.live_paths = set()
+        self._condition = None
+        self._sweeper = None
+
+    def _pick_directory(self, settings):
+        ram_dir = settings['ram_dir']
+        if settings['prefer_ram'] and ram_dir:
+            try:
+                os.makedirs(ram_dir, exist_ok=True)
+                stat = os.statvfs(ram_dir)
+                # Small tmpfs mounts (e.g. Docker's 64MB default) would fill up mid-download
+                if os.access(ram_dir, os.W_OK) and stat.f_bavail * stat.f_frsize >= self.quota:
+                    return ram_dir
+            except OSError:
+                pass
+        os.makedirs(settings['disk_dir'], exist_ok=True)
+        return settings['disk_dir']
+
+    @property
+    def condition(self):
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    def spool(self):
+        return Spool(self)
+
+    async def _acquire(self, size):
+        if size > self.quota:
+            raise SpoolFullError(size)
+        async with self.condition:
+            try:
+                await asyncio.wait_for(
+                    self.condition.wait_for(lambda: self.reserved + size <= self.quota), self.max_wait
+                )
+            except asyncio.TimeoutError:
+                raise SpoolFullError(size)
+            self.reserved += size
+
+    async def _release(self, size):
+        if not size:
+            return
+        async with self.condition:
+            self.reserved -= size
+            self.condition.notify_all()
+
+    def disk_usage(self):
+        try:
+            with os.scandir(self.directory) as entries:
+                return sum(entry.stat().st_size for entry in entries
+                           if entry.name.startswith(PREFIX) and entry.is_file())
+        except OSError:
+            return 0
+
+    def sweep(self):
+        """Delete spool files of dead processes and anything older than stale_after"""
+        removed = 0
+        now = time.time()
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return 0
+        for entry in entries:
+            if not entry.name.startswith(PREFIX) or entry.path in self.live_paths:
+                continue
+            owner = entry.name[len(PREFIX):].split("_", 1)[0]
+            try:
+                dead_owner = owner.isdigit() and int(owner) != os.getpid() and not pid_alive(int(owner))
+                if dead_owner or now - entry.stat().st_mtime > self.stale_after:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def start(self):
+        removed = self.sweep()
+        if removed:
+            print(f"Spool: removed {removed} stale files from {self.directory}")
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        if self._sweeper:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            await asyncio.to_thread(self.sweep)
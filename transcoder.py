@@ -0,0 +1,120 @@
+"""
+Optional ffmpeg post-processing. Oversize videos are re-encoded to fit the
+upload limit and every MP4 is remuxed with faststart so playback starts
+before the whole file arrives. ffmpeg runs from a small process pool whose
+size is the CPU budget; nothing here runs when ffmpeg is not installed.
+"""
+
+import asyncio
+import os
+import resource
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from metrics import TRANSCODE_SECONDS, TRANSCODE_CPU_SECONDS, TRANSCODE_BYTES_SAVED, TRANSCODE_JOBS
+
+PROBE_TIMEOUT = 15
+AUDIO_BITRATE = 96_000
+MIN_VIDEO_BITRATE = 150_000
+
+def _run(args, timeout):
+    """Run one ffmpeg/ffprobe command in a pool process, return (ok, stdout, cpu seconds)"""
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    try:
+        result = subprocess.run(args, capture_output=True, timeout=timeout)
+        ok = result.returncode == 0
+        stdout = result.stdout.decode('utf-8', 'replace')
+    except subprocess.TimeoutExpired:
+        ok, stdout = False, ""
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    return ok, stdout, cpu
+
+def remux_job(ffmpeg, input_path, output_path, timeout):
+    ok, _, cpu = _run([ffmpeg, "-y", "-v", "error", "-i", input_path, "-map", "0", "-c", "copy",
+                       "-movflags", "+faststart", output_path], timeout)
+    return ok, cpu
+
+def transcode_job(ffmpeg, ffprobe, input_path, output_path, max_size, timeout):
+    cpu = 0
+    duration = None
+    if ffprobe:
+        ok, stdout, cpu = _run([ffprobe, "-v", "error", "-show_entries", "format=duration",
+                                "-of", "default=noprint_wrappers=1:nokey=1", input_path], PROBE_TIMEOUT)
+        try:
+            duration = float(stdout.strip()) if ok else None
+        except ValueError:
+            duration = None
+    args = [ffmpeg, "-y", "-v", "error", "-i", input_path, "-c:v", "libx264", "-preset", "veryfast",
+            "-vf", "scale='min(720,iw)':-2", "-c:a", "aac", "-b:a", str(AUDIO_BITRATE)]
+    if duration:
+        # 5% headroom for the container overhead
+        bitrate = max(int(max_size * 8 * 0.95 / duration) - AUDIO_BITRATE, MIN_VIDEO_BITRATE)
+        args += ["-b:v", str(bitrate), "-maxrate", str(bitrate), "-bufsize", str(bitrate * 2)]
+    else:
+        args += ["-crf", "30"]
+    ok, _, encode_cpu = _run(args + ["-movflags", "+faststart", output_path], timeout)
+    return ok, cpu + encode_cpu
+
+class Transcoder:
+    def __init__(self, settings):
+        self.ffmpeg = shutil.which(settings['ffmpeg']) if settings['enabled'] else None
+        self.ffprobe = shutil.which(settings['ffprobe']) if self.ffmpeg else None
+        self.max_workers = settings['max_workers']
+        self.timeout = settings['timeout']
+        self.max_input_size = settings['max_input_size']
+        self.faststart = settings['faststart']
+        self._pool = None
+
+    @property
+    def available(self):
+        return self.ffmpeg is not None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def process(self, input_path, max_size):
+        """Return a path that fits max_size, None if the video cannot be made to fit"""
+        base = os.path.splitext(input_path)[0]
+        if os.path.getsize(input_path) > max_size:
+            output_path = base + "_transcoded.mp4"
+            ok = await self._run_job('transcode', input_path, output_path, transcode_job,
+                                     self.ffmpeg, self.ffprobe, input_path, output_path, max_size, self.timeout)
+            if ok and os.path.getsize(output_path) <= max_size:
+                return output_path
+            if ok:
+                os.remove(output_path)
+            return None
+        if self.faststart:
+            output_path = base + "_faststart.mp4"
+            ok = await self._run_job('remux', input_path, output_path, remux_job,
+                                     self.ffmpeg, input_path, output_path, self.timeout)
+            # Remuxing is only an optimisation, so the original is fine on failure
+            return output_path if ok else input_path
+        return input_path
+
+    async def _run_job(self, op, input_path, output_path, job, *job_args):
+        loop = asyncio.get_running_loop()
+        try:
+            with TRANSCODE_SECONDS.time(op=op):
+                ok, cpu = await asyncio.wait_for(loop.run_in_executor(self.pool, job, *job_args), self.timeout + PROBE_TIMEOUT + 5)
+        except Exception as e:
+            print(f"Error running ffmpeg {op}:", e)
+            ok, cpu = False, 0
+        TRANSCODE_CPU_SECONDS.inc(cpu, op=op)
+        if not ok or not os.path.exists(output_path):
+            TRANSCODE_JOBS.inc(op=op, result='error')
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            return False
+        TRANSCODE_JOBS.inc(op=op, result='success')
+        TRANSCODE_BYTES_SAVED.inc(max(0, os.path.getsize(input_path) - os.path.getsize(output_path)), op=op)
+        return True
@@ -0,0 +1,75 @@
+"""
+Single-flight TTL cache for extracted CDN media urls. Concurrent lookups of
+the same post share one page fetch, and resolved urls are kept until
+shortly before the first CDN link among them expires.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs
+
+def cdn_expiry(video_url):
+    """Return the expiry timestamp encoded in a CDN url, if any"""
+    params = parse_qs(urlsplit(video_url).query)
+    try:
+        if 'oe' in params:
+            return int(params['oe'][0], 16)
+        for name in ('expires', 'Expires', 'x-expires'):
+            if name in params:
+                return int(params[name][0])
+    except ValueError:
+        pass
+    return None
+
+class ExtractionCache:
+    def __init__(self, ttl=600, max_size=5000, expiry_margin=60):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.expiry_margin = expiry_margin
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.data = OrderedDict()  # key -> (media items, expires)
+        self._inflight = {}
+
+    async def get(self, key, fetch):
+        entry = self.data.get(key)
+        if entry and entry[1] > time.time():
+            self.data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        if entry:
+            del self.data[key]
+        task = self._inflight.get(key)
+        if task:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            # The fetch runs as its own task so a cancelled caller does not
+            # cancel it for everyone else waiting on the same key
+            task = asyncio.ensure_future(fetch())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._fetch_done(key, t))
+        return await asyncio.shield(task)
+
+    def _fetch_done(self, key, task):
+        self._inflight.pop(key, None)
+        if task.cancelled() or task.exception() or not task.result():
+            return
+        self.set(key, task.result())
+
+    def set(self, key, value):
+        expires = time.time() + self.ttl
+        # A single url or a list of MediaItems from a carousel
+        urls = [value] if isinstance(value, str) else [item.url for item in value]
+        for url in urls:
+            cdn_expires = cdn_expiry(url)
+            if cdn_expires:
+                expires = min(expires, cdn_expires - self.expiry_margin)
+        if expires <= time.time():
+            return
+        self.data[key] = (value, expires)
+        self.data.move_to_end(key)
+        while len(self.data) > self.max_size:
+            self.data.popitem(last=False)
@@ -1,39 +1,281 @@
-import requests
+import asyncio
+import io
+import os
 import re
+import threading
+import httpx
+from urllib.parse import urlsplit
+from config import DOWNLOAD_SETTINGS, RESILIENCE_SETTINGS
+from url_cache import ExtractionCache
+from extractors import Link, registry
+from resilience import UpstreamGuard, CircuitOpenError
+from metrics import EXTRACT_SECONDS, DOWNLOAD_SECONDS, DOWNLOAD_BYTES, DOWNLOADS_IN_FLIGHT
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+}
+
+class FileTooLargeError(Exception):
+    pass
 
 class VideoDownloader:
+    def __init__(self, timeout=None, max_connections=None, transport=None):
+        self.timeout = timeout or DOWNLOAD_SETTINGS['download_timeout']
+        self.max_connections = max_connections or DOWNLOAD_SETTINGS['max_connections']
+        self.chunk_size = DOWNLOAD_SETTINGS['chunk_size']
+        self.segment_size = DOWNLOAD_SETTINGS['segment_size']
+        self.max_segments = DOWNLOAD_SETTINGS['max_segments']
+        self.segment_retries = DOWNLOAD_SETTINGS['segment_retries']
+        self.max_buffer_size = DOWNLOAD_SETTINGS['max_buffer_size']
+        self.transport = transport
+        self.url_cache = ExtractionCache(ttl=DOWNLOAD_SETTINGS['url_cache_ttl'])
+        self.upstream = UpstreamGuard(RESILIENCE_SETTINGS)
+        self._client = None
+
+    @property
+    def client(self):
+        # One keep-alive pool shared by every request for the life of the bot
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                headers=HEADERS,
+                timeout=httpx.Timeout(self.timeout, connect=10),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections // 2 or 1
+                ),
+                follow_redirects=True,
+                transport=self.transport
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def resolve(self, url):
+        return registry.match(url)
+
     def is_valid_url(self, url):
-        return "instagram.com" in url and ("/reel/" in url or "/p/" in url)
+        return self.resolve(url) is not None
+
+    def available(self, link):
+        """False while the circuit for the link's host is open"""
+        return self.upstream.available(urlsplit(link.canonical_url).hostname)
 
-    def get_video_url(self, url):
+    async def get_media(self, url):
+        """Every media item behind the link, a single video for reels"""
         try:
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-            }
-            r = requests.get(url, headers=headers)
-            if r.status_code == 200:
-                match = re.search(r'"video_url":"([^"]+)"', r.text)
-                if match:
-                    return match.group(1).replace('\\u0026', '&')
-                match2 = re.search(r'<meta property="og:video" content="([^"]+)"', r.text)
-                if match2:
-                    return match2.group(1)
+            link = url if isinstance(url, Link) else self.resolve(url)
+            if not link or not link.extractor.supported:
+                return []
+            with EXTRACT_SECONDS.time(platform=link.platform):
+                return await self.url_cache.get(link.key, lambda: self._extract_media(link))
+        except CircuitOpenError:
+            raise
         except Exception as e:
             print("Error extracting video url:", e)
+        return []
+
+    async def get_video_url(self, url):
+        items = await self.get_media(url)
+        videos = [item for item in items if item.kind == 'video']
+        return videos[0].url if videos else None
+
+    async def _extract_media(self, link):
+        host = urlsplit(link.canonical_url).hostname
+        fetch = lambda: link.extractor.extract_media(self.client, link)
+        return await self.upstream.call(host, fetch, self.timeout)
+
+    async def download_video(self, video_url, filename, max_size=None):
+        sink = await asyncio.to_thread(FileSink, filename)
+        try:
+            with DOWNLOADS_IN_FLIGHT.track(), DOWNLOAD_SECONDS.time(mode='file'):
+                await asyncio.wait_for(self._fetch(video_url, sink, max_size), self.timeout)
+            await asyncio.to_thread(sink.close)
+            return filename
+        except FileTooLargeError:
+            await asyncio.to_thread(sink.close)
+            os.remove(filename)
+            raise
+        except Exception as e:
+            print("Error downloading video:", e)
+            await asyncio.to_thread(sink.close)
+            os.remove(filename)
+        except BaseException:
+            # Cancelled, e.g. a sibling carousel item failed: close without
+            # another await that could be cancelled too
+            sink.close()
+            os.remove(filename)
+            raise
         return None
 
-    def download_video(self, video_url, filename):
+    async def download_to_buffer(self, video_url, max_size=None):
+        """Download into memory, skipping the temp file round trip"""
+        sink = MemorySink()
         try:
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-            }
-            r = requests.get(video_url, stream=True, headers=headers)
-            if r.status_code == 200:
-                with open(filename, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                return filename
+            with DOWNLOADS_IN_FLIGHT.track(), DOWNLOAD_SECONDS.time(mode='memory'):
+                await asyncio.wait_for(self._fetch(video_url, sink, max_size), self.timeout)
+            sink.buffer.seek(0)
+            return sink.buffer
+        except FileTooLargeError:
+            sink.buffer.close()
+            raise
         except Exception as e:
             print("Error downloading video:", e)
-        return None
\ No newline at end of file
+            sink.buffer.close()
+        return None
+
+    async def _fetch(self, video_url, sink, max_size):
+        # The first segment doubles as the Range probe: a 206 tells us the
+        # total size, a 200 means the server ignores Range
+        headers = {"Range": f"bytes=0-{self.segment_size - 1}"}
+        async with self.client.stream("GET", video_url, headers=headers) as r:
+            r.raise_for_status()
+            if r.status_code != 206:
+                await self._stream(r, sink, max_size)
+                return
+            _, last, total = self._check_range(r, 0)
+            if max_size and total > max_size:
+                raise FileTooLargeError(total)
+            await sink.allocate(total)
+            last = min(last, self.segment_size - 1)
+            offset = 0
+            try:
+                async for chunk in r.aiter_bytes(self.chunk_size):
+                    chunk = chunk[:last + 1 - offset]
+                    await sink.write_at(offset, chunk)
+                    offset += len(chunk)
+                    if offset > last:
+                        break
+            except httpx.HTTPError:
+                pass  # the rest of the first segment is retried below
+            finally:
+                DOWNLOAD_BYTES.inc(offset)
+        if offset >= total:
+            return
+        segments = [(start, min(start + self.segment_size, total) - 1)
+                    for start in range(self.segment_size, total, self.segment_size)]
+        if offset < self.segment_size:
+            segments.insert(0, (offset, min(self.segment_size, total) - 1))
+        semaphore = asyncio.Semaphore(self.max_segments)
+
+        async def fetch_segment(start, end):
+            async with semaphore:
+                await self._fetch_segment(video_url, sink, start, end)
+
+        tasks = [asyncio.create_task(fetch_segment(start, end)) for start, end in segments]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # On a failed segment or the download timeout, stop the others
+            # before the caller closes the sink
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _fetch_segment(self, video_url, sink, start, end):
+        offset = start
+        for attempt in range(self.segment_retries + 1):
+            try:
+                headers = {"Range": f"bytes={offset}-{end}"}
+                async with self.client.stream("GET", video_url, headers=headers) as r:
+                    self._check_range(r, offset)
+                    async for chunk in r.aiter_bytes(self.chunk_size):
+                        # A server that sends more than asked must not overwrite the next segment
+                        chunk = chunk[:end + 1 - offset]
+                        await sink.write_at(offset, chunk)
+                        offset += len(chunk)
+                        DOWNLOAD_BYTES.inc(len(chunk))
+                        if offset > end:
+                            break
+                if offset > end:
+                    return
+            except httpx.HTTPError:
+                if attempt == self.segment_retries:
+                    raise
+            # Resume from the last byte received instead of refetching the segment
+            await asyncio.sleep(0.5 * 2 ** attempt)
+        raise httpx.TransportError(f"Segment {start}-{end} incomplete at {offset}")
+
+    def _check_range(self, r, offset):
+        """(first, last, total) of a 206 that starts at offset, else an HTTPStatusError to retry"""
+        content_range = parse_content_range(r.headers.get('Content-Range'))
+        if r.status_code != 206 or not content_range or content_range[0] != offset:
+            raise httpx.HTTPStatusError(
+                f"Expected 206 from byte {offset}, got {r.status_code} {r.headers.get('Content-Range')}",
+                request=r.request, response=r
+            )
+        return content_range
+
+    async def _stream(self, r, sink, max_size):
+        """Single connection fallback with a buffer that grows as data keeps coming"""
+        content_length = r.headers.get('Content-Length')
+        if max_size and content_length and int(content_length) > max_size:
+            raise FileTooLargeError(int(content_length))
+        received = 0
+        buffer = bytearray()
+        flush_size = self.chunk_size
+        try:
+            async for chunk in r.aiter_bytes():
+                received += len(chunk)
+                if max_size and received > max_size:
+                    raise FileTooLargeError(received)
+                buffer += chunk
+                if len(buffer) >= flush_size:
+                    await sink.write(bytes(buffer))
+                    buffer.clear()
+                    flush_size = min(flush_size * 2, self.max_buffer_size)
+            if buffer:
+                await sink.write(bytes(buffer))
+        finally:
+            DOWNLOAD_BYTES.inc(received)
+
+def parse_content_range(content_range):
+    """(first, last, total) from a "bytes 0-99/1234" header, None if malformed or the total is unknown"""
+    match = re.fullmatch(r'bytes (\d+)-(\d+)/(\d+)', (content_range or '').strip())
+    return tuple(int(value) for value in match.groups()) if match else None
+
+class FileSink:
+    def __init__(self, filename):
+        self.file = open(filename, 'wb')
+        # A cancelled to_thread() call keeps running, so writes and close are
+        # serialized and a write that lost the race finds the file closed
+        self._lock = threading.Lock()
+
+    async def allocate(self, size):
+        await asyncio.to_thread(self._locked, self.file.truncate, size)
+
+    async def write_at(self, offset, data):
+        await asyncio.to_thread(self._locked, lambda: os.pwrite(self.file.fileno(), data, offset))
+
+    async def write(self, data):
+        await asyncio.to_thread(self._locked, self.file.write, data)
+
+    def _locked(self, operation, *args):
+        with self._lock:
+            if self.file.closed:
+                raise ValueError("write to a closed sink")
+            return operation(*args)
+
+    def close(self):
+        with self._lock:
+            self.file.close()
+
+class MemorySink:
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    async def allocate(self, size):
+        # truncate() never grows a BytesIO; writing the last byte sizes it once
+        # instead of reallocating as out-of-order segments land
+        if size:
+            self.buffer.seek(size - 1)
+            self.buffer.write(b'\0')
+
+    async def write_at(self, offset, data):
+        self.buffer.seek(offset)
+        self.buffer.write(data)
+
+    async def write(self, data):
+        self.buffer.write(data)
@@ -0,0 +1,68 @@
+"""
+Webhook serving mode: Telegram pushes updates to our own HTTP server,
+which feeds them into the Application's update queue.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import logging
+import signal
+from telegram import Update
+from http_server import HTTPServer, Response, json_response
+
+logger = logging.getLogger(__name__)
+
+def default_secret_token(bot_token):
+    return hashlib.sha256(bot_token.encode('utf-8')).hexdigest()
+
+def create_server(application, settings, health=None, routes=None):
+    server = HTTPServer(settings['listen'], settings['port'])
+    secret_token = settings['secret_token'] or default_secret_token(application.bot.token)
+
+    async def webhook(request):
+        received = request.headers.get("x-telegram-bot-api-secret-token", "")
+        if not hmac.compare_digest(received, secret_token):
+            return Response("Forbidden", 403)
+        try:
+            update = Update.de_json(request.json(), application.bot)
+        except ValueError:
+            return Response("Bad request", 400)
+        await application.update_queue.put(update)
+        return Response("OK")
+
+    async def health_check(request):
+        return json_response(health() if health else {"status": "ok"})
+
+    server.route("POST", settings['path'], webhook)
+    server.route("GET", "/", health_check)
+    server.route("GET", "/health", health_check)
+    for (method, path), handler in (routes or {}).items():
+        server.route(method, path, handler)
+    return server, secret_token
+
+async def run_webhook(application, settings, allowed_updates, health=None, routes=None):
+    server, secret_token = create_server(application, settings, health, routes)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        await server.start()
+        await application.bot.set_webhook(
+            url=settings['url'].rstrip('/') + settings['path'],
+            secret_token=secret_token,
+            allowed_updates=allowed_updates,
+            max_connections=settings['max_connections']
+        )
+        logger.info(f"Webhook listening on {settings['listen']}:{server.port}{settings['path']}")
+        try:
+            await stop_event.wait()
+        finally:
+            await server.stop()
+            await application.stop()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
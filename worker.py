@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Download worker for the split deployment (DEPLOY_MODE=split). The bot
+process only answers updates and queues links in the shared job queue;
+any number of these processes lease the jobs, download and deliver the
+videos through the Bot API.
+
+    python worker.py
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import socket
+import sys
+from datetime import datetime, timezone
+from telegram import Bot, Chat, Message
+from telegram.request import HTTPXRequest
+from config import BOT_TOKEN, DOWNLOAD_SETTINGS, WORKER_SETTINGS
+from job_queue import JobQueue
+import bot
+
+logger = logging.getLogger(__name__)
+
+def job_status_message(bot_api, payload):
+    status_message = Message(payload['status_message_id'], datetime.now(timezone.utc), Chat(payload['chat_id'], Chat.PRIVATE))
+    status_message.set_bot(bot_api)
+    return status_message
+
+async def report_failed_job(bot_api, payload):
+    """Tell the user about a job that killed every worker that ran it"""
+    link = bot.video_downloader.resolve(payload['url'])
+    user = bot.UserPrefs(payload['user_id'], fresh=True)
+    if link:
+        bot.record_result(user, link, 'error')
+    await job_status_message(bot_api, payload).edit_text(bot.get_text(user, 'download_error'))
+
+async def run_job(bot_api, payload):
+    link = bot.video_downloader.resolve(payload['url'])
+    user = bot.UserPrefs(payload['user_id'], fresh=True)
+    chat_id = payload['chat_id']
+    status_message = job_status_message(bot_api, payload)
+    if not link:
+        await status_message.edit_text(bot.get_text(user, 'download_error'))
+        return
+    # Another worker may have uploaded the same post since it was queued
+    if await bot.send_cached_video(bot_api, chat_id, user, link):
+        await status_message.edit_text(bot.get_text(user, 'video_sent'))
+        return
+    await bot.download_video(bot_api, chat_id, status_message, user, link)
+
+async def keep_lease(job_queue, job_id, worker_id):
+    """Renew the lease until cancelled; returns False once another worker has the job"""
+    while True:
+        await asyncio.sleep(job_queue.lease_seconds / 3)
+        if not await asyncio.to_thread(job_queue.renew, job_id, worker_id):
+            logger.warning(f"Lost the lease on job {job_id}")
+            return False
+
+async def worker_loop(bot_api, job_queue, worker_id, stopping):
+    while not stopping.is_set():
+        job = await asyncio.to_thread(job_queue.lease, worker_id)
+        if not job:
+            try:
+                await asyncio.wait_for(stopping.wait(), WORKER_SETTINGS['poll_interval'])
+            except asyncio.TimeoutError:
+                pass
+            continue
+        job_id, payload, attempt = job
+        if attempt > job_queue.max_attempts:
+            logger.warning(f"Job {job_id} failed {job_queue.max_attempts} times, reporting it to the user")
+        elif attempt > 1:
+            logger.info(f"Redelivering job {job_id}, attempt {attempt}")
+        lease = asyncio.create_task(keep_lease(job_queue, job_id, worker_id))
+        try:
+            if attempt > job_queue.max_attempts:
+                await report_failed_job(bot_api, payload)
+            else:
+                await run_job(bot_api, payload)
+        except asyncio.CancelledError:
+            # Shutting down mid-job: let another worker pick it up right away
+            await asyncio.to_thread(job_queue.release, job_id, worker_id)
+            raise
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}")
+        finally:
+            lost = lease.done()
+            lease.cancel()
+        # A job whose lease lapsed belongs to the worker that re-leased it
+        if lost or not await asyncio.to_thread(job_queue.complete, job_id, worker_id):
+            logger.warning(f"Job {job_id} was taken over by another worker, leaving it to them")
+
+async def run_worker(token=BOT_TOKEN, base_url=None, concurrency=None):
+    concurrency = concurrency or DOWNLOAD_SETTINGS['workers']
+    request = HTTPXRequest(connection_pool_size=concurrency * 2 + 2)
+    if base_url:
+        bot_api = Bot(token, base_url=f"{base_url}/bot", base_file_url=f"{base_url}/file/bot", request=request)
+    else:
+        bot_api = Bot(token, request=request)
+    job_queue = bot.job_queue or JobQueue(
+        db_file=WORKER_SETTINGS['queue_file'],
+        lease_seconds=WORKER_SETTINGS['lease_seconds'],
+        max_attempts=WORKER_SETTINGS['max_attempts']
+    )
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stopping.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    await bot_api.initialize()
+    bot.spool_manager.start()
+    tasks = [asyncio.create_task(worker_loop(bot_api, job_queue, worker_id, stopping)) for _ in range(concurrency)]
+    print(f"✅ Worker {worker_id} ishga tushdi ({concurrency} ta oqim)")
+    try:
+        await stopping.wait()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await bot.spool_manager.stop()
+        await bot.video_downloader.close()
+        bot.transcoder.close()
+        bot.file_id_cache.close()
+        bot.events.flush()
+        job_queue.close()
+        await bot_api.shutdown()
+
+def main():
+    if WORKER_SETTINGS['mode'] != 'split':
+        print("❌ Worker faqat DEPLOY_MODE=split rejimida ishlaydi")
+        sys.exit(1)
+    try:
+        asyncio.run(run_worker())
+    except Exception as e:
+        logger.error(f"Worker xatoligi: {e}")
+        print(f"❌ Worker xatoligi: {e}")
+
+if __name__ == '__main__':
+    main()